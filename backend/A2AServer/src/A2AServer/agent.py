@@ -1,5 +1,7 @@
+import asyncio
 import logging
 import os
+import time
 import traceback
 import json
 import base64
@@ -9,8 +11,13 @@ from pydantic import BaseModel
 from datetime import datetime
 
 from A2AServer.mcp_client.client import *
+from A2AServer.common.utils.hot_log import HotPathLogger
+from A2AServer.session_store import SessionStore
+from A2AServer.context_manager import ContextManager, DEFAULT_CONTEXT_TOKENS, estimate_tokens
+from A2AServer.tool_selector import ToolSelector
 
 logger = logging.getLogger(__name__)
+hot_log = HotPathLogger(logger)
 
 
 def base64_to_dict(base64_str: str) -> dict:
@@ -28,16 +35,40 @@ class BasicAgent:
     """Agent to access Deep Search"""
 
     SUPPORTED_CONTENT_TYPES = ["text", "text/plain"]
+    # 单个MCP server启动和列出工具的默认超时时间（秒），可以在配置里用 startupTimeout 覆盖
+    DEFAULT_STARTUP_TIMEOUT = 30
+    # 写进用户消息的当前时间的精度
+    TIME_FORMATS = {
+        "day": "%Y-%m-%d",
+        "hour": "%Y-%m-%d %H:00",
+        "minute": "%Y-%m-%d %H:%M",
+        "second": "%Y-%m-%d %H:%M:%S",
+    }
 
     def __init__(self, config_path="mcp_config.json", model_name="deepseek-chat",prompt_file="prompt.txt", provider="deepseek",
-                 quiet_mode=False, log_messages_path=None):
+                 quiet_mode=False, log_messages_path=None, max_sessions=1000, session_ttl=3600,
+                 tool_concurrency=4, context_tokens=None, tool_result_chars=1000, summarize_context=False,
+                 time_granularity="minute", tool_top_k=None, pinned_tools=()):
         """
         Synchronous initialization.
         Loads config and sets up basic attributes.
         Asynchronous setup (starting servers, listing tools) is done in the 'setup' method.
+        max_sessions / session_ttl: 按 sessionId 保存的多轮对话的数量上限和空闲过期秒数
+        tool_concurrency: 模型一次返回多个工具调用时，最多并发执行的数量
+        context_tokens: 发送给模型的对话的 token 上限，默认取配置文件里这个模型的 contextTokens
+        tool_result_chars: 超出上限时，较早的工具结果截断到的字符数
+        summarize_context: 超出上限时是否用模型总结被丢弃的早期对话
+        time_granularity: 当前时间的精度（day/hour/minute/second），越粗同一时间段内的请求越容易命中模型服务的前缀缓存
+        tool_top_k / pinned_tools: 每次请求只发送和问题最相关的 tool_top_k 个工具以及固定的工具（完整名称，server_tool），
+            默认发送全部工具；也可以在配置文件里用 toolSelection: {"topK": 8, "pinned": [...]} 设置
         """
+        if time_granularity not in self.TIME_FORMATS:
+            raise ValueError(f"Unknown time granularity: {time_granularity}")
         self.config_path = config_path
         self.model_name = model_name
+        self.time_format = self.TIME_FORMATS[time_granularity]
+        # prompt 文件的缓存: (mtime, 内容)，文件修改后重新读取
+        self._prompt_cache = None
         self.quiet_mode = quiet_mode
         self.log_messages_path = log_messages_path
 
@@ -45,22 +76,38 @@ class BasicAgent:
         config = self.file
         self.servers_cfg = config.get("mcpServers", {})
         self.models_cfg = config.get("models", [])
+        # 同一轮里最多同时执行的工具调用数，可以在配置文件里用 toolConcurrency 设置
+        self.tool_concurrency = config.get("toolConcurrency", tool_concurrency)
+        # 幂等工具的结果缓存，在配置文件里按工具开启（cacheTools）
+        self.tool_cache = ToolResultCache.from_config(config)
+        selection_cfg = config.get("toolSelection", {})
+        self.tool_top_k = tool_top_k if tool_top_k is not None else selection_cfg.get("topK")
+        self.pinned_tools = list(pinned_tools) or selection_cfg.get("pinned", [])
+        self.tool_selector = None
         assert os.path.exists(prompt_file), f"Agent prompt file 必须存在，请检查: {prompt_file}"
         # Choose a model (synchronous)
         self.chosen_model = {"model": model_name, "provider": provider, "prompt_file": prompt_file}
+        if context_tokens is None:
+            model_cfg = next((m for m in self.models_cfg if m.get("model") == model_name), {})
+            context_tokens = model_cfg.get("contextTokens", DEFAULT_CONTEXT_TOKENS)
+        self.context = ContextManager(
+            max_tokens=context_tokens,
+            tool_result_chars=tool_result_chars,
+            summarizer=self._summarize if summarize_context else None,
+        )
         self.is_ready = True
 
         # Initialize attributes that will be populated asynchronously in setup()
         self.servers = {}
         self.all_functions = []
-        self.conversation = [] # Initial conversation might be built later in run() or here
+        self.server_startup_timings = {}
+        # 每个 sessionId 一份对话，多个任务可以并发共用同一个 agent 和 MCP 连接
+        self.sessions = SessionStore(max_sessions=max_sessions, ttl=session_ttl)
+        self._setup_lock = asyncio.Lock()
         self.tool_ready = False
-        # 为啥在这里初始化工具后，工具就无法被调通呢，
-        # loop = asyncio.get_event_loop()
-        # try:
-        #     self.tool_ready = loop.run_until_complete(self.setup_tools())
-        # except RuntimeError:
-        #     self.tool_ready = asyncio.run(self.setup_tools())
+        # 设置后共用这个 agent 的 MCP server 和工具，自己从不启动 server（见 AgentPool）
+        self.tool_source = None
+        # 工具要在服务的事件循环里初始化：由 warmup() 在服务启动时调用，或者在第一次推理时调用
 
 
     async def setup_tools(self):
@@ -68,69 +115,48 @@ class BasicAgent:
         Asynchronous setup method.
         Starts servers and gathers tools.
         Returns True if setup was successful, False otherwise.
+
+        All servers start concurrently, each bounded by its ``startupTimeout``
+        (seconds, default DEFAULT_STARTUP_TIMEOUT) from the MCP config, so
+        setup takes as long as the slowest server. Per-server startup times
+        are kept in ``server_startup_timings``.
         """
         if not self.is_ready:
              print("Agent cannot be set up: Model not found.")
              return False
 
         print("Starting MCP servers...")
+        started = time.perf_counter()
+        # 并发启动所有的MCP的server，gather 的结果按配置文件的顺序排列，工具顺序保持稳定
+        # return_exceptions：一个 server 出了意外的异常，其它正常启动的 server 仍然可用
+        results = await asyncio.gather(
+            *(self._start_server(server_name, conf) for server_name, conf in self.servers_cfg.items()),
+            return_exceptions=True,
+        )
         successful_servers = {}
         all_functions = []
-        # 初始化MCP的server
-        for server_name, conf in self.servers_cfg.items():
-            client = None
-            if "url" in conf:  # SSE server
-                client = SSEMCPClient(server_name, conf["url"])
-            elif "command" in conf:  # Local process-based server
-                 client = MCPClient(
-                     server_name=server_name,
-                     command=conf.get("command"),
-                     args=conf.get("args", []),
-                     env=conf.get("env", {})
-                 )
-            else:
-                 if not self.quiet_mode:
-                     print(f"[WARN] Skipping server {server_name}: No 'url' or 'command' specified.")
-                 continue
-
-            try:
-                ok = await client.start() # <-- AWAIT is valid here (inside async def)
-                if not ok:
-                    if not self.quiet_mode:
-                        print(f"[WARN] Could not start server {server_name}")
-                    # Ensure client is stopped even if start failed
-                    if client: await client.stop()
-                    continue
-                else:
-                    print(f"[MCP Tool OK] {server_name}")
-                    successful_servers[server_name] = client
-
-                    # gather tools
-                    try:
-                         tools = await client.list_tools() # <-- AWAIT is valid here
-                         for t in tools:
-                             input_schema = t.get("inputSchema") or {"type": "object", "properties": {}}
-                             fn_def = {
-                                 "name": f"{server_name}_{t['name']}",
-                                 "description": t.get("description", ""),
-                                 "parameters": input_schema
-                             }
-                             all_functions.append(fn_def)
-                    except Exception as e:
-                        if not self.quiet_mode:
-                            print(f"[WARN] Error listing tools for {server_name}: {e}")
-                        # Consider if failing to list tools should stop processing for this server
-
-
-            except Exception as e: # Catch potential errors during client creation or start
-                if not self.quiet_mode:
-                    print(f"[WARN] Exception starting server {server_name}: {e}")
-                # Ensure client is stopped if created before exception
-                if 'client' in locals() and client: await client.stop()
-
+        timings = {}
+        for server_name, result in zip(self.servers_cfg, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Failed to start server {server_name}: {result!r}")
+                continue
+            _, client, functions, elapsed = result
+            timings[server_name] = elapsed
+            if client is not None:
+                successful_servers[server_name] = client
+                all_functions.extend(functions)
 
         self.servers = successful_servers
-        self.all_functions = all_functions
+        # 工具按名称排序，每次请求的工具定义完全相同，不受配置顺序影响
+        self.all_functions = sorted(all_functions, key=lambda fn: fn["name"])
+        if self.tool_top_k:
+            # 工具的名称、描述和参数只在启动时建一次索引
+            self.tool_selector = ToolSelector(self.all_functions, top_k=self.tool_top_k, pinned=self.pinned_tools)
+        self.server_startup_timings = timings
+        logger.info(
+            f"MCP servers started in {time.perf_counter() - started:.2f}s: "
+            + ", ".join(f"{name}={elapsed:.2f}s" for name, elapsed in timings.items())
+        )
 
         if not self.servers:
             error_msg = "No MCP servers could be started."
@@ -142,13 +168,106 @@ class BasicAgent:
         self.tool_ready = True # Setup was successful
         return True
 
+    async def warmup(self) -> bool:
+        """Start the MCP servers and load the tools once.
+
+        Concurrent callers wait for the same setup instead of each starting
+        its own server processes. An agent with a ``tool_source`` warms that
+        agent up instead and uses its servers and tools. Returns whether the
+        tools are ready.
+        """
+        if self.tool_source is not None:
+            await self.tool_source.warmup()
+            self.share_tools(self.tool_source)
+            return self.tool_ready
+        async with self._setup_lock:
+            if not self.tool_ready:
+                await self.setup_tools()
+        return self.tool_ready
+
+    def share_tools(self, source: "BasicAgent"):
+        """Use the MCP servers and tools already started by ``source``."""
+        self.servers = source.servers
+        self.all_functions = source.all_functions
+        self.tool_selector = source.tool_selector
+        self.server_startup_timings = source.server_startup_timings
+        self.tool_ready = source.tool_ready
+
+    async def _start_server(self, server_name, conf):
+        """Start one MCP server and list its tools.
+
+        Returns (server_name, client, functions, elapsed seconds); client is
+        None when the server could not be started in time.
+        """
+        started = time.perf_counter()
+        client = None
+        functions = []
+        if "url" in conf:  # SSE server
+            client = SSEMCPClient(server_name, conf["url"])
+        elif "command" in conf:  # Local process-based server
+             client = MCPClient(
+                 server_name=server_name,
+                 command=conf.get("command"),
+                 args=conf.get("args", []),
+                 env=conf.get("env", {})
+             )
+        else:
+             if not self.quiet_mode:
+                 print(f"[WARN] Skipping server {server_name}: No 'url' or 'command' specified.")
+             return server_name, None, functions, time.perf_counter() - started
+
+        timeout = conf.get("startupTimeout", self.DEFAULT_STARTUP_TIMEOUT)
+        try:
+            # asyncio.timeout 在当前任务里执行，SSE 客户端的上下文不会跨任务进入
+            async with asyncio.timeout(timeout):
+                ok = await client.start()
+            if not ok:
+                if not self.quiet_mode:
+                    print(f"[WARN] Could not start server {server_name}")
+                # Ensure client is stopped even if start failed
+                await self._stop_client(server_name, client)
+                return server_name, None, functions, time.perf_counter() - started
+            print(f"[MCP Tool OK] {server_name}")
+
+            # gather tools
+            try:
+                 async with asyncio.timeout(max(timeout - (time.perf_counter() - started), 0)):
+                     tools = await client.list_tools()
+                 for t in tools:
+                     input_schema = t.get("inputSchema") or {"type": "object", "properties": {}}
+                     fn_def = {
+                         "name": f"{server_name}_{t['name']}",
+                         "description": t.get("description", ""),
+                         "parameters": input_schema
+                     }
+                     functions.append(fn_def)
+            except Exception as e:
+                if not self.quiet_mode:
+                    print(f"[WARN] Error listing tools for {server_name}: {e!r}")
+                # Consider if failing to list tools should stop processing for this server
+        except Exception as e: # Catch potential errors during client creation or start, including the timeout
+            if not self.quiet_mode:
+                print(f"[WARN] Exception starting server {server_name}: {e!r}")
+            # Ensure client is stopped if created before exception
+            await self._stop_client(server_name, client)
+            return server_name, None, functions, time.perf_counter() - started
+        return server_name, client, functions, time.perf_counter() - started
+
+    async def _stop_client(self, server_name, client):
+        """Stop a client that failed to start; errors while stopping are only logged."""
+        try:
+            await client.stop()
+        except Exception as e:
+            # 例如 SSE 客户端在 __aenter__ 被超时取消后，__aexit__ 也可能出错
+            logger.warning(f"Error stopping server {server_name} after a failed start: {e!r}")
+
     async def run_inference(self, user_query, sessionId, stream=True):
         """
         推理和工具的设置
         """
         if not self.tool_ready:
             #  如果没设置过相关的MCP工具
-            await self.setup_tools()
+            await self.warmup()
         if not self.is_ready:
              print("Agent is not ready. Setup failed or model not found.")
              # Depending on requirements, you might return an error or raise an exception
@@ -158,88 +277,152 @@ class BasicAgent:
              return "Agent setup failed."
 
 
-        # Build initial conversation (system message + user query)
-        self._build_initial_conversation(user_query) # This helper can be synchronous
-
-
         # try:
         if stream:
-            return self._stream_response_generator(sessionId) # Returns an async generator
+            return self._stream_response_generator(sessionId, user_query) # Returns an async generator
         else:
-            return await self._non_stream_response() # Returns the final text
+            return await self._non_stream_response(sessionId, user_query) # Returns the final text
         # finally:
         #     # Ensure cleanup is called when run() finishes or an exception occurs
         #     await self.cleanup() # <-- AWAIT is valid here
 
-    def _build_initial_conversation(self, user_query):
-         # Helper method to build the initial conversation list (synchronous)
-         self.conversation = []
-         # 默认的prompt
-         agent_prompt = "You are a helpful assistant."
+    def _load_prompt(self):
+         """The agent prompt, re-read from disk only when the file's mtime changes."""
+         prompt_file = self.chosen_model["prompt_file"]
          try:
-             with open(self.chosen_model["prompt_file"], "r", encoding="utf-8") as f:
-                 agent_prompt = f.read()
-             self.conversation.append({"role": "system", "content": agent_prompt})
+             mtime = os.stat(prompt_file).st_mtime_ns
+             if self._prompt_cache is None or self._prompt_cache[0] != mtime:
+                 with open(prompt_file, "r", encoding="utf-8") as f:
+                     self._prompt_cache = (mtime, f.read())
+             return self._prompt_cache[1]
          except Exception as e:
              logger.warning(f"Failed to read Agent prompt file: {e}")
-             self.conversation.append({"role": "system", "content": agent_prompt})
-        # 加上当前的时间
-         self.conversation[0]['content'] = f"当前时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}。" + self.conversation[0]['content']
-         self.conversation.append({"role": "user", "content": user_query})
-         print(f"发起的conversation: {self.conversation}")
+             # 默认的prompt
+             return "You are a helpful assistant."
 
-    async def _stream_response_generator(self, sessionId):
+    def _build_initial_conversation(self, user_query, history=()):
+         # Helper method to build the initial conversation list (synchronous)
+         # 不变的部分放在前面，每次请求都完全相同，模型服务的前缀缓存才能命中：
+         # system prompt + 这个 session 之前的对话 + 当前的问题，当前时间放在最后
+         conversation = [{"role": "system", "content": self._load_prompt()}]
+         conversation.extend(history)
+         conversation.append({"role": "user", "content": f"{user_query}\n\n当前时间: {datetime.now().strftime(self.time_format)}"})
+         hot_log.debug("conversation", "发起的conversation: %s", conversation)
+         return conversation
+
+    async def _stream_response_generator(self, sessionId, user_query):
          """Handles the streaming response logic (async generator)."""
+         # 同一个 session 的请求按顺序执行，不同 session 之间并发
+         async with self.sessions.acquire(sessionId) as session:
+             conversation = self._build_initial_conversation(user_query, session.messages)
+             async for chunk in self._stream_turn(conversation, self._select_tools(user_query)):
+                 yield chunk
+             # 只有完整结束的一轮对话才写回 session
+             session.messages = conversation[1:]
+
+    def _select_tools(self, user_query):
+         """Tools sent with this turn's requests; all of them unless tool selection is enabled."""
+         if self.tool_selector is None:
+             return self.all_functions
+         functions = self.tool_selector.select(user_query)
+         if logger.isEnabledFor(logging.DEBUG):
+             hot_log.debug(
+                 "tool_selection", "工具筛选: %d/%d 个工具, schema 约 %d/%d tokens",
+                 len(functions), len(self.all_functions),
+                 estimate_tokens(json.dumps(functions, ensure_ascii=False)),
+                 estimate_tokens(json.dumps(self.all_functions, ensure_ascii=False)),
+             )
+         return functions
+
+    async def _stream_turn(self, conversation, functions):
          #分5种返回类型，1. reasoning, 2. normal,  4. tool_call, 5. tool_result
          while True:
-             generator = await generate_text(self.conversation, self.chosen_model, self.all_functions, stream=True)
+             await self._fit_context(conversation)
+             generator = await generate_text(conversation, self.chosen_model, functions, stream=True)
              accumulated_text = ""
              tool_calls_processed = False
-
-             async for chunk in generator: # AWAIT is used to iterate over the async generator
-                 if chunk.get("is_chunk", False):
-                     if chunk.get("token", False):
-                         if chunk.get("is_reasoning"):
-                             yield {"text": chunk["assistant_text"], "type": "reasoning"}
-                         else:
-                            yield {"text": chunk["assistant_text"], "type": "normal"} # YIELD is used in a generator
-                     if not chunk.get("is_reasoning"):
-                        accumulated_text += chunk["assistant_text"]
-                 else:
-                     remaining = chunk["assistant_text"][len(accumulated_text):]
-                     if remaining:
-                         yield {"text": remaining, "type": "normal"} # YIELD here as well 剩余文本
-
-                     tool_calls = chunk.get("tool_calls", [])
-                     if tool_calls:
-                         for tc in tool_calls:
-                             tc["type"] = "function"
-                         assistant_message = {
-                             "role": "assistant",
-                             "content": chunk["assistant_text"],
-                             "tool_calls": tool_calls
-                         }
-                         self.conversation.append(assistant_message)
-                         yield {"text": f"{json.dumps(tool_calls, ensure_ascii=False)}", "type": "tool_call"}
-
-                         for tc in tool_calls:
-                             if tc.get("function", {}).get("name"):
-                                 # 对工具进行参数的修改
-                                 result = await process_tool_call(tc, self.servers, self.quiet_mode) # AWAIT valid here
-                                 if result:
-                                     self.conversation.append(result)
-                                     tool_calls_processed = True
-                                     yield {"text": f"{json.dumps(result)}", "type": "tool_result"}
+             # 模型还在输出时就已经开始执行的工具调用: id -> (arguments, task)
+             limits = self._tool_limits()
+             started = {}
+
+             try:
+                 async for chunk in generator: # AWAIT is used to iterate over the async generator
+                     if chunk.get("usage"):
+                         self.context.record_usage(chunk["usage"])
+                         continue
+                     if chunk.get("tool_call_ready"):
+                         for tc in chunk["tool_calls"]:
+                             if tc["id"] not in started:
+                                 started[tc["id"]] = (tc["function"]["arguments"], self._start_tool_call(tc, limits))
+                         continue
+                     if chunk.get("is_chunk", False):
+                         if chunk.get("token", False):
+                             if chunk.get("is_reasoning"):
+                                 yield {"text": chunk["assistant_text"], "type": "reasoning"}
+                             else:
+                                yield {"text": chunk["assistant_text"], "type": "normal"} # YIELD is used in a generator
+                         if not chunk.get("is_reasoning"):
+                            accumulated_text += chunk["assistant_text"]
+                     else:
+                         if chunk.get("error"):
+                             # 模型服务出错，这一轮失败，不能把错误信息当作回答
+                             raise RuntimeError(chunk["assistant_text"])
+                         remaining = chunk["assistant_text"][len(accumulated_text):]
+                         if remaining:
+                             yield {"text": remaining, "type": "normal"} # YIELD here as well 剩余文本
+
+                         tool_calls = chunk.get("tool_calls", [])
+                         if not tool_calls:
+                             # 最终回答也留在对话里，作为下一轮的上下文
+                             conversation.append({"role": "assistant", "content": chunk["assistant_text"]})
+                         if tool_calls:
+                             for tc in tool_calls:
+                                 tc["type"] = "function"
+                             assistant_message = {
+                                 "role": "assistant",
+                                 "content": chunk["assistant_text"],
+                                 "tool_calls": tool_calls
+                             }
+                             conversation.append(assistant_message)
+                             # 工具调用和结果以对象的形式交给 task manager，不再序列化成字符串
+                             yield {"data": tool_calls, "type": "tool_call"}
+
+                             # 同一轮的工具并发执行，哪个先完成先返回哪个的结果，对话里仍按调用顺序追加
+                             calls = [tc for tc in tool_calls if tc.get("function", {}).get("name")]
+                             messages = [None] * len(calls)
+                             async for index, message, result in self._run_tool_calls(calls, started, limits):
+                                 messages[index] = message
+                                 yield {"data": {**message, "content": result}, "type": "tool_result"}
+                             conversation.extend(messages)
+                             tool_calls_processed = bool(calls)
+             finally:
+                 # 取消时关闭模型的流，停止继续生成 token
+                 await generator.aclose()
+                 # 提前执行但最终没有用到的工具调用
+                 for _, task in started.values():
+                     task.cancel()
              if not tool_calls_processed:
                  break
 
 
-    async def _non_stream_response(self):
+    async def _non_stream_response(self, sessionId, user_query):
          """Handles the non-streaming response logic."""
+         async with self.sessions.acquire(sessionId) as session:
+             conversation = self._build_initial_conversation(user_query, session.messages)
+             final_text = await self._non_stream_turn(conversation, self._select_tools(user_query))
+             session.messages = conversation[1:]
+         return final_text
+
+    async def _non_stream_turn(self, conversation, functions):
          # Move the non-stream logic from original init here
          final_text = ""
          while True:
-             gen_result = await generate_text(self.conversation, self.chosen_model, self.all_functions, stream=False) # AWAIT valid here
+             await self._fit_context(conversation)
+             gen_result = await generate_text(conversation, self.chosen_model, functions, stream=False) # AWAIT valid here
+             if gen_result.get("usage"):
+                 self.context.record_usage(gen_result["usage"])
+             if gen_result.get("error"):
+                 raise RuntimeError(gen_result["assistant_text"])
 
              assistant_text = gen_result["assistant_text"]
              final_text = assistant_text
@@ -250,29 +433,111 @@ class BasicAgent:
                  for tc in tool_calls:
                      tc["type"] = "function"
                  assistant_message["tool_calls"] = tool_calls
-             self.conversation.append(assistant_message)
-             logger.info(f"Added assistant message: {json.dumps(assistant_message, indent=2)}")
+             conversation.append(assistant_message)
+             hot_log.debug("conversation", "Added assistant message: %s", assistant_message)
 
              if not tool_calls:
                  break
 
-             for tc in tool_calls:
-                 result = await process_tool_call(tc, self.servers, self.quiet_mode) # AWAIT valid here
-                 if result:
-                     self.conversation.append(result)
-                     logger.info(f"Added tool result: {json.dumps(result, indent=2)}")
+             messages = [None] * len(tool_calls)
+             async for index, message, _ in self._run_tool_calls(tool_calls):
+                 messages[index] = message
+             conversation.extend(messages)
+             hot_log.debug("tool_result", "Added tool results: %s", messages)
 
          return final_text
 
 
+    async def _fit_context(self, conversation):
+         # 每次请求模型之前把对话控制在 token 预算内，较早的工具结果先被截断
+         prompt_tokens = await self.context.fit(conversation)
+         hot_log.debug("prompt_tokens", "发送给模型的对话约 %d tokens, %d 条消息", prompt_tokens, len(conversation))
+
+    async def _summarize(self, messages):
+         """Summarize dropped turns with the agent's own model."""
+         prompt = [
+             {"role": "system", "content": "请简要总结下面的对话，保留和后续问题相关的事实、结论和工具结果。"},
+             {"role": "user", "content": json.dumps(messages, ensure_ascii=False)},
+         ]
+         result = await generate_text(prompt, self.chosen_model, [], stream=False)
+         if result.get("error"):
+             raise RuntimeError(result["assistant_text"])
+         return result["assistant_text"]
+
+    def _tool_limits(self):
+         """Concurrency cap and serial-tool lock shared by the tool calls of one turn."""
+         return asyncio.Semaphore(self.tool_concurrency), asyncio.Lock()
+
+    def _start_tool_call(self, tc, limits):
+         semaphore, serial_lock = limits
+
+         async def run():
+             if self._is_serial_tool(tc["function"]["name"]):
+                 # 先排队拿串行锁再占并发名额，排队中的串行调用不占用名额，不会挡住其它工具
+                 async with serial_lock, semaphore:
+                     return await run_tool_call(tc, self.servers, self.quiet_mode, self.tool_cache)
+             async with semaphore:
+                 return await run_tool_call(tc, self.servers, self.quiet_mode, self.tool_cache)
+
+         return asyncio.create_task(run())
+
+    async def _run_tool_calls(self, tool_calls, started=None, limits=None):
+         """Run the tool calls of one turn concurrently.
+
+         Yields (index, message, result) in completion order. At most
+         ``tool_concurrency`` calls run at once; serial tools (see
+         ``_is_serial_tool``) run one at a time in the order they were called.
+         ``started`` maps tool call ids to (arguments, task) of calls that were
+         already dispatched while the model was still streaming; they are
+         reused when the final arguments match.
+         """
+         limits = limits or self._tool_limits()
+         started = started if started is not None else {}
+         pending = {}
+         for index, tc in enumerate(tool_calls):
+             arguments, task = started.pop(tc.get("id"), (None, None))
+             if task is not None and arguments != tc["function"].get("arguments"):
+                 # 提前执行时的参数和最终的不一致，按最终的参数重新执行
+                 task.cancel()
+                 task = None
+             if task is None:
+                 task = self._start_tool_call(tc, limits)
+             pending[task] = index
+         try:
+             while pending:
+                 done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                 for task in sorted(done, key=pending.get):
+                     index = pending.pop(task)
+                     message, result = task.result()
+                     yield index, message, result
+         finally:
+             # 取消或者出错时，不再等待剩下的工具
+             for task in pending:
+                 task.cancel()
+
+    def _is_serial_tool(self, func_name):
+        """Whether a tool must not run concurrently with other serial tools.
+
+        Set per server in the MCP config, either ``"serial": true`` for all of
+        its tools or ``"serialTools": ["tool_name", ...]``.
+        """
+        srv_name, _, tool_name = func_name.partition("_")
+        conf = self.servers_cfg.get(srv_name, {})
+        return bool(conf.get("serial")) or tool_name in conf.get("serialTools", [])
+
     async def cleanup(self):
         """Clean up servers and log messages."""
         print("Cleaning up servers...")
+        logger.info(f"Tool cache stats: {self.tool_cache.stats()}")
+        logger.info(f"Context stats: {self.context.stats()}")
         if self.log_messages_path:
             # Pass attributes needed for logging
-            await log_messages_to_file(self.conversation, self.all_functions, self.log_messages_path) # AWAIT valid here
-        for cli in self.servers.values():
-            await cli.stop() # AWAIT valid here
+            for session in self.sessions.sessions():
+                await log_messages_to_file(session.messages, self.all_functions, self.log_messages_path) # AWAIT valid here
+        if self.tool_source is None:
+            # 共用的 server 由 tool_source 负责关闭
+            for cli in self.servers.values():
+                await cli.stop() # AWAIT valid here
         print("Cleanup complete.")
 
     def get_agent_response(self, response: str) -> dict[str, Any]:
@@ -299,7 +564,7 @@ class BasicAgent:
         """Stream updates from the MCP agent.
         # sessionId作为知识库的关联信息, 重新初始化知识库的mcpClient
         """
-        print(f"问题: {query}的sessionId为： {sessionId}")
+        logger.info("问题: %s的sessionId为： %s", query, sessionId)
         try:
             # Initial response to acknowledge the query
             yield {
@@ -324,7 +589,7 @@ class BasicAgent:
                     yield {
                         "is_task_complete": False,  # Indicate it's an intermediate part
                         "require_user_input": False,
-                        "content": chunk["text"],  # Yield the actual content chunk
+                        "content": chunk["text"] if "text" in chunk else chunk["data"],  # Yield the actual content chunk
                         "type":chunk["type"],
                     }
                 yield {
@@ -0,0 +1,143 @@
+"""A pool of BasicAgent execution contexts sharing MCP server connections."""
+
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, Callable, Dict
+
+from A2AServer.agent import BasicAgent
+
+logger = logging.getLogger(__name__)
+
+
+class AgentPool:
+    """Lease ``size`` warm BasicAgent contexts to concurrent requests.
+
+    Only ``mcp_replicas`` of the contexts start MCP servers; context ``i``
+    uses the servers and tools of replica ``i % mcp_replicas`` and never
+    starts its own, even when the replica failed to start, so requests are
+    spread over several stdio pipes per server without starting one set of
+    server processes per context. Session history, the tool result cache
+    and context metrics are shared by all contexts, so any context can serve
+    any session. A request first takes its session, so queued turns of one
+    session do not hold contexts, then waits for a free context in FIFO
+    order; that wait is recorded in ``stats()``.
+
+    A replica whose servers fail to start is not retried on later requests
+    as long as another replica is healthy: it and its contexts use the
+    servers of a healthy replica instead. Only when every replica failed
+    does the next request warm them up again.
+
+    A single BasicAgent already serves concurrent sessions over one set of
+    servers, so with ``mcp_replicas=1`` the pool only caps the number of
+    concurrent requests at ``size``; more replicas are what add MCP
+    throughput.
+    """
+
+    def __init__(self, factory: Callable[[], BasicAgent], size: int = 4, mcp_replicas: int = 1):
+        if size <= 0:
+            raise ValueError("size must be positive")
+        if not 0 < mcp_replicas <= size:
+            raise ValueError("mcp_replicas must be between 1 and size")
+        self.size = size
+        self.mcp_replicas = mcp_replicas
+        self.contexts = [factory() for _ in range(size)]
+        self.replicas = self.contexts[:mcp_replicas]
+        primary = self.contexts[0]
+        for index, context in enumerate(self.contexts[1:], 1):
+            context.sessions = primary.sessions
+            context.tool_cache = primary.tool_cache
+            context.context = primary.context
+            if index >= mcp_replicas:
+                context.tool_source = self.replicas[index % mcp_replicas]
+        self._free: asyncio.Queue = asyncio.Queue()
+        for context in self.contexts:
+            self._free.put_nowait(context)
+        self._warmup_lock = asyncio.Lock()
+        # 启动失败、改用其它副本 server 的副本数
+        self.failed_replicas = 0
+        self.leases = 0
+        self.waiting = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def tool_ready(self) -> bool:
+        return any(replica.tool_ready for replica in self.replicas)
+
+    async def warmup(self) -> bool:
+        """Start the MCP servers of every replica once and hand them to the other contexts."""
+        async with self._warmup_lock:
+            if not self.tool_ready:
+                await asyncio.gather(*(replica.warmup() for replica in self.replicas))
+                self._route_contexts()
+        return self.tool_ready
+
+    def _route_contexts(self):
+        healthy = [replica for replica in self.replicas if replica.tool_ready]
+        if not healthy:
+            return
+        self.failed_replicas = self.mcp_replicas - len(healthy)
+        if self.failed_replicas:
+            logger.error(
+                f"{self.failed_replicas} of {self.mcp_replicas} MCP replicas failed to start, "
+                f"their contexts use the {len(healthy)} healthy replicas"
+            )
+        for index, context in enumerate(self.contexts):
+            replica = self.replicas[index % self.mcp_replicas]
+            if replica.tool_ready:
+                source = None if context is replica else replica
+            else:
+                # 失败的副本不再重试，连同它的上下文改用健康副本的 server
+                source = healthy[index % len(healthy)]
+            context.tool_source = source
+            if source is not None:
+                context.share_tools(source)
+
+    @contextlib.asynccontextmanager
+    async def lease(self, session_id: str | None = None):
+        """Borrow a free context for one request of ``session_id``."""
+        if not self.tool_ready:
+            await self.warmup()
+        async with contextlib.AsyncExitStack() as stack:
+            if session_id is not None:
+                # 先拿到 session 再借上下文，同一个 session 排队的请求不占用池里的上下文
+                await stack.enter_async_context(self.contexts[0].sessions.acquire(session_id))
+            started = time.perf_counter()
+            self.waiting += 1
+            try:
+                context = await self._free.get()
+            finally:
+                self.waiting -= 1
+            waited = time.perf_counter() - started
+            self.leases += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if waited > 0.1:
+                logger.info(f"Waited {waited * 1000:.0f} ms for a free agent context")
+            try:
+                yield context
+            finally:
+                self._free.put_nowait(context)
+
+    def invoke(self, query: str, sessionId: str) -> Dict[str, Any]:
+        return self.contexts[0].invoke(query, sessionId)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "mcp_replicas": self.mcp_replicas,
+            "failed_replicas": self.failed_replicas,
+            "in_use": self.size - self._free.qsize(),
+            "waiting": self.waiting,
+            "leases": self.leases,
+            "wait_avg_ms": self.wait_total / self.leases * 1000 if self.leases else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+        }
+
+    async def cleanup(self):
+        logger.info(f"Agent pool stats: {self.stats()}")
+        # 只有副本持有 MCP server，其它上下文共用它们的连接
+        for replica in self.replicas:
+            await replica.cleanup()
@@ -0,0 +1,204 @@
+"""Offline batch inference: run a JSONL file of queries through one warm BasicAgent.
+
+Usage::
+
+    python -m A2AServer.batch --input questions.jsonl --output results.jsonl \\
+        --mcp_config mcp_config.json --model deepseek-chat --provider deepseek --concurrency 8
+
+Every input line is a JSON object with a ``query`` and an optional ``id``
+(the line number when missing). Every output line holds the id, query,
+answer, the tool calls and results, and the timing of one query. The output
+file doubles as the checkpoint: rerunning the same command skips queries
+that already have a successful result, and retries the failed ones.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, List
+
+import asyncclick as click
+from dotenv import load_dotenv
+
+from A2AServer.agent import BasicAgent
+
+logger = logging.getLogger(__name__)
+
+
+def read_queries(input_path: str) -> List[Dict[str, Any]]:
+    """Queries of the input file; a query without an id gets its line number."""
+    queries = []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not record.get("query"):
+                raise ValueError(f"Line {line_no} of {input_path} has no query")
+            queries.append({"id": str(record.get("id", line_no)), "query": record["query"]})
+    return queries
+
+
+def load_checkpoint(output_path: str) -> set:
+    """Ids with a successful result in the output file.
+
+    A line cut off by an interrupted run is removed, so appended results
+    start on a new line.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb") as f:
+        data = f.read()
+    complete = data[:data.rfind(b"\n") + 1]
+    if len(complete) != len(data):
+        logger.warning(f"Dropping an incomplete last line from {output_path}")
+        with open(output_path, "wb") as f:
+            f.write(complete)
+    for line in complete.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get("error"):
+            done.discard(record["id"])
+        else:
+            done.add(record["id"])
+    return done
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(len(ordered) * pct / 100))
+    return ordered[rank - 1]
+
+
+async def run_query(agent: BasicAgent, item: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one query and collect its answer, tool trace and timing."""
+    started = time.perf_counter()
+    first_token = None
+    answer = []
+    tool_calls = []
+    tool_results = []
+    error = None
+    completed = False
+    # 每个问题用自己的 sessionId，问题之间不共享对话历史
+    async for chunk in agent.stream(item["query"], f"batch-{item['id']}"):
+        if chunk.get("require_user_input"):
+            error = chunk.get("updates")
+            break
+        if chunk.get("is_task_complete"):
+            completed = True
+        kind = chunk.get("type")
+        if kind == "normal" and not chunk["is_task_complete"]:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            answer.append(chunk["content"])
+        elif kind == "tool_call":
+            tool_calls.extend(chunk["content"])
+        elif kind == "tool_result":
+            tool_results.append(chunk["content"])
+    if not completed and error is None:
+        # 没有以完成结束的运行都算失败，下次重新运行
+        error = "The agent stopped without a result"
+    return {
+        "id": item["id"],
+        "query": item["query"],
+        "answer": "".join(answer),
+        "tool_calls": tool_calls,
+        "tool_results": tool_results,
+        "error": error,
+        "first_token_s": first_token,
+        "latency_s": time.perf_counter() - started,
+    }
+
+
+async def run_batch(agent: BasicAgent, input_path: str, output_path: str, concurrency: int = 4) -> Dict[str, Any]:
+    """Run the queries of ``input_path`` not yet in ``output_path`` and return the run summary."""
+    if concurrency <= 0:
+        raise ValueError("concurrency must be positive")
+    queries = read_queries(input_path)
+    done = load_checkpoint(output_path)
+    pending = [item for item in queries if item["id"] not in done]
+    logger.info(f"{len(queries)} queries, {len(queries) - len(pending)} already done, {len(pending)} to run")
+
+    # 所有问题共用一组 MCP server，只启动一次
+    if not await agent.warmup():
+        raise RuntimeError("Failed to start the MCP servers")
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    latencies = []
+    failed = 0
+    started = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def worker():
+            nonlocal failed
+            while not queue.empty():
+                item = queue.get_nowait()
+                try:
+                    record = await run_query(agent, item)
+                except Exception as e:
+                    logger.error(f"Query {item['id']} failed: {e!r}")
+                    record = {"id": item["id"], "query": item["query"], "error": repr(e)}
+                if record["error"]:
+                    failed += 1
+                else:
+                    latencies.append(record["latency_s"])
+                # 每个结果写完立即落盘，中断后从这里继续
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                finished = len(latencies) + failed
+                if finished % 10 == 0 or finished == len(pending):
+                    logger.info(f"Finished {finished}/{len(pending)} queries")
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(pending)))))
+
+    elapsed = time.perf_counter() - started
+    return {
+        "total": len(queries),
+        "skipped": len(queries) - len(pending),
+        "succeeded": len(latencies),
+        "failed": failed,
+        "elapsed_s": elapsed,
+        "throughput_qps": (len(latencies) + failed) / elapsed if pending and elapsed > 0 else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+    }
+
+
+@click.command()
+@click.option("--input", "input_path", required=True, help="问题的 JSONL 文件，每行包含 query 和可选的 id")
+@click.option("--output", "output_path", required=True, help="结果的 JSONL 文件，同时作为断点，重新运行时跳过已成功的问题")
+@click.option("--prompt", "agent_prompt_file", default="prompt.txt", help="Agent 的 prompt 文件路径（默认为 prompt.txt）")
+@click.option("--model", "model_name", default="deepseek-chat", help="使用的模型名称（如 deepseek-chat）")
+@click.option("--provider", "provider", default="deepseek", help="模型提供方名称（如 deepseek、openai 等）")
+@click.option("--mcp_config", "mcp_config_path", default="mcp_config.json", help="MCP 配置文件路径（默认为 mcp_config.json）")
+@click.option("--concurrency", "concurrency", default=4, type=int, help="同时处理的问题数（默认 4）")
+async def main(input_path, output_path, agent_prompt_file, model_name, provider, mcp_config_path, concurrency):
+    """批量运行 JSONL 文件里的问题"""
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    agent = BasicAgent(config_path=mcp_config_path, model_name=model_name, prompt_file=agent_prompt_file,
+                       provider=provider, quiet_mode=True)
+    try:
+        summary = await run_batch(agent, input_path, output_path, concurrency)
+    finally:
+        await agent.cleanup()
+    logger.info(
+        f"{summary['succeeded']} succeeded, {summary['failed']} failed, {summary['skipped']} skipped in "
+        f"{summary['elapsed_s']:.1f}s: {summary['throughput_qps']:.2f} queries/s, "
+        f"p50 {summary['latency_p50_s']:.2f}s, p95 {summary['latency_p95_s']:.2f}s"
+    )
+    click.echo(json.dumps(summary, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,6 +7,7 @@ from A2AServer.common.A2Atypes import (
     SendTaskRequest,
     SendTaskResponse,
     JSONRPCRequest,
+    JSONRPCResponse,
     GetTaskResponse,
     CancelTaskResponse,
     CancelTaskRequest,
@@ -18,9 +19,19 @@ from A2AServer.common.A2Atypes import (
     A2AClientJSONError,
     SendTaskStreamingRequest,
     SendTaskStreamingResponse,
+    TaskResubscriptionRequest,
 )
 import json
 
+# 批量请求中每种请求对应的响应类型
+BATCH_RESPONSE_TYPES = {
+    SendTaskRequest: SendTaskResponse,
+    GetTaskRequest: GetTaskResponse,
+    CancelTaskRequest: CancelTaskResponse,
+    SetTaskPushNotificationRequest: SetTaskPushNotificationResponse,
+    GetTaskPushNotificationRequest: GetTaskPushNotificationResponse,
+}
+
 
 class A2AClient:
     def __init__(self, agent_card: AgentCard = None, url: str = None):
@@ -51,6 +62,27 @@ class A2AClient:
                 except httpx.RequestError as e:
                     raise A2AClientHTTPError(400, str(e)) from e
 
+    async def resubscribe_task(
+        self, payload: dict[str, Any]
+    ) -> AsyncIterable[SendTaskStreamingResponse]:
+        """Reattach to a task's event stream.
+
+        Pass ``{"id": task_id, "metadata": {"offset": n}}`` to replay events
+        from sequence number ``n`` (the ``seq`` in each event's metadata).
+        """
+        request = TaskResubscriptionRequest(params=payload)
+        with httpx.Client(timeout=None) as client:
+            with connect_sse(
+                client, "POST", self.url, json=request.model_dump()
+            ) as event_source:
+                try:
+                    for sse in event_source.iter_sse():
+                        yield SendTaskStreamingResponse(**json.loads(sse.data))
+                except json.JSONDecodeError as e:
+                    raise A2AClientJSONError(str(e)) from e
+                except httpx.RequestError as e:
+                    raise A2AClientHTTPError(400, str(e)) from e
+
     async def _send_request(self, request: JSONRPCRequest) -> dict[str, Any]:
         async with httpx.AsyncClient() as client:
             try:
@@ -65,6 +97,41 @@ class A2AClient:
             except json.JSONDecodeError as e:
                 raise A2AClientJSONError(str(e)) from e
 
+    async def batch(self, requests: list[JSONRPCRequest]) -> list[JSONRPCResponse]:
+        """Send several non-streaming requests in one JSON-RPC batch.
+
+        Responses are returned in the same order as ``requests``.
+        """
+        for request in requests:
+            if type(request) not in BATCH_RESPONSE_TYPES:
+                raise ValueError(f"{request.method} cannot be sent in a batch")
+
+        async with httpx.AsyncClient() as client:
+            try:
+                response = await client.post(
+                    self.url,
+                    json=[request.model_dump() for request in requests],
+                    timeout=30,
+                )
+                response.raise_for_status()
+                data = response.json()
+            except httpx.HTTPStatusError as e:
+                raise A2AClientHTTPError(e.response.status_code, str(e)) from e
+            except json.JSONDecodeError as e:
+                raise A2AClientJSONError(str(e)) from e
+
+        if not isinstance(data, list):
+            raise A2AClientJSONError(f"Expected a batch response, got: {data}")
+
+        by_id = {item.get("id"): item for item in data}
+        results = []
+        for request in requests:
+            item = by_id.get(request.id)
+            if item is None:
+                raise A2AClientJSONError(f"Missing response for request {request.id}")
+            results.append(BATCH_RESPONSE_TYPES[type(request)](**item))
+        return results
+
     async def get_task(self, payload: dict[str, Any]) -> GetTaskResponse:
         request = GetTaskRequest(params=payload)
         return GetTaskResponse(**await self._send_request(request))
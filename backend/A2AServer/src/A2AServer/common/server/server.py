@@ -1,32 +1,57 @@
 from starlette.applications import Starlette
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 from sse_starlette.sse import EventSourceResponse
 from starlette.requests import Request
 from A2AServer.common.A2Atypes import (
-    A2ARequest,
     JSONRPCResponse,
     InvalidRequestError,
     JSONParseError,
+    MethodNotFoundError,
     GetTaskRequest,
     CancelTaskRequest,
     SendTaskRequest,
     SetTaskPushNotificationRequest,
     GetTaskPushNotificationRequest,
     InternalError,
+    JSONRPCError,
     AgentCard,
     TaskResubscriptionRequest,
     SendTaskStreamingRequest,
 )
 from pydantic import ValidationError
+import asyncio
+import contextlib
 import json
 from typing import AsyncIterable, Any
 from A2AServer.common.server.task_manager import TaskManager
+from A2AServer.common.server.utils import json_loads
+from A2AServer.common.utils.hot_log import stop_queued_logging
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# method -> (请求模型, TaskManager 上的处理函数名)，只针对匹配的模型做校验
+REQUEST_HANDLERS = {
+    "tasks/get": (GetTaskRequest, "on_get_task"),
+    "tasks/send": (SendTaskRequest, "on_send_task"),
+    "tasks/sendSubscribe": (SendTaskStreamingRequest, "on_send_task_subscribe"),
+    "tasks/cancel": (CancelTaskRequest, "on_cancel_task"),
+    "tasks/pushNotification/set": (SetTaskPushNotificationRequest, "on_set_task_push_notification"),
+    "tasks/pushNotification/get": (GetTaskPushNotificationRequest, "on_get_task_push_notification"),
+    "tasks/resubscribe": (TaskResubscriptionRequest, "on_resubscribe_to_task"),
+}
+
+# 批量请求里只允许非流式的方法
+BATCH_METHODS = {
+    "tasks/get",
+    "tasks/send",
+    "tasks/cancel",
+    "tasks/pushNotification/set",
+    "tasks/pushNotification/get",
+}
+
 
 class A2AServer:
     def __init__(
@@ -36,13 +61,17 @@ class A2AServer:
         endpoint="/",
         agent_card: AgentCard = None,
         task_manager: TaskManager = None,
+        workers: int = 1,
+        warmup: bool = True,
     ):
         self.host = host
         self.port = port
+        self.workers = workers
+        self.warmup = warmup
         self.endpoint = endpoint
         self.task_manager = task_manager
         self.agent_card = agent_card
-        self.app = Starlette()
+        self.app = Starlette(lifespan=self._lifespan)
         # 添加 CORS 中间件
         self.app.add_middleware(
             CORSMiddleware,
@@ -54,6 +83,29 @@ class A2AServer:
         self.app.add_route(
             "/.well-known/agent.json", self._get_agent_card, methods=["GET"]
         )
+        self.app.add_route("/ready", self._get_ready, methods=["GET"])
+
+    @contextlib.asynccontextmanager
+    async def _lifespan(self, app: Starlette):
+        # uvicorn 在 lifespan 启动完成之后才开始监听端口，预热完成前不会接收请求
+        if self.warmup and self.task_manager is not None:
+            started = asyncio.get_running_loop().time()
+            try:
+                await self.task_manager.warmup()
+                elapsed = asyncio.get_running_loop().time() - started
+                # agent 的 warmup 失败时返回 False 而不抛异常，以 is_ready 为准
+                if self.task_manager.is_ready():
+                    logger.info(f"Warm-up finished in {elapsed:.2f}s")
+                else:
+                    logger.error(f"Warm-up failed after {elapsed:.2f}s: the agent is not ready")
+            except Exception as e:
+                # 预热失败不阻止服务启动，第一次请求时会再次初始化，/ready 返回 503
+                logger.error(f"Warm-up failed: {e}")
+        yield
+        # 关闭时把写缓冲中的任务落盘
+        task_store = getattr(self.task_manager, "task_store", None)
+        if task_store is not None:
+            await task_store.close()
 
     def start(self):
         if self.agent_card is None:
@@ -64,52 +116,153 @@ class A2AServer:
 
         import uvicorn
 
-        uvicorn.run(self.app, host=self.host, port=self.port)
+        if self.workers <= 1:
+            uvicorn.run(self.app, host=self.host, port=self.port)
+            return
+
+        task_store = getattr(self.task_manager, "task_store", None)
+        if task_store is None or not task_store.shared_across_processes:
+            raise ValueError(
+                "workers > 1 requires a task store shared across processes, e.g. SQLiteTaskStore"
+            )
+        self._start_workers()
+
+    def _start_workers(self):
+        """Fork ``self.workers`` uvicorn processes that accept on one shared socket.
+
+        Task state lives in the shared task store, but the agent run, its SSE
+        fan-out and replay buffer stay in the worker that received
+        tasks/sendSubscribe. tasks/cancel and tasks/resubscribe for an active
+        task only work on that worker; other workers answer with an
+        UnsupportedOperationError instead of a wrong result.
+        """
+        import multiprocessing
+        import socket
+        import uvicorn
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.set_inheritable(True)
+        self.task_manager.workers = self.workers
+
+        def serve():
+            config = uvicorn.Config(self.app, host=self.host, port=self.port)
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+            finally:
+                # fork 出的子进程退出时不执行 atexit，先把排队的日志写完
+                stop_queued_logging()
+
+        # 使用 fork，子进程直接继承 app 和 task_manager，不需要可导入的 app 路径
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=serve) for _ in range(self.workers)]
+        logger.info(f"Starting {self.workers} workers on {self.host}:{self.port}")
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+        finally:
+            sock.close()
+
+    def _get_ready(self, request: Request) -> JSONResponse:
+        ready = self.task_manager is not None and self.task_manager.is_ready()
+        return JSONResponse({"ready": ready}, status_code=200 if ready else 503)
 
     def _get_agent_card(self, request: Request) -> JSONResponse:
         return JSONResponse(self.agent_card.model_dump(exclude_none=True))
 
     async def _process_request(self, request: Request):
         try:
-            body = await request.json()
-            json_rpc_request = A2ARequest.validate_python(body)
-
-            if isinstance(json_rpc_request, GetTaskRequest):
-                result = await self.task_manager.on_get_task(json_rpc_request)
-            elif isinstance(json_rpc_request, SendTaskRequest):
-                result = await self.task_manager.on_send_task(json_rpc_request)
-            elif isinstance(json_rpc_request, SendTaskStreamingRequest):
-                result = await self.task_manager.on_send_task_subscribe(
-                    json_rpc_request
-                )
-            elif isinstance(json_rpc_request, CancelTaskRequest):
-                result = await self.task_manager.on_cancel_task(json_rpc_request)
-            elif isinstance(json_rpc_request, SetTaskPushNotificationRequest):
-                result = await self.task_manager.on_set_task_push_notification(json_rpc_request)
-            elif isinstance(json_rpc_request, GetTaskPushNotificationRequest):
-                result = await self.task_manager.on_get_task_push_notification(json_rpc_request)
-            elif isinstance(json_rpc_request, TaskResubscriptionRequest):
-                result = await self.task_manager.on_resubscribe_to_task(
-                    json_rpc_request
-                )
-            else:
-                logger.warning(f"Unexpected request type: {type(json_rpc_request)}")
-                raise ValueError(f"Unexpected request type: {type(request)}")
+            body = json_loads(await request.body())
+            if isinstance(body, list):
+                return await self._process_batch(body)
+
+            method = body.get("method") if isinstance(body, dict) else None
+            if method not in REQUEST_HANDLERS:
+                response = self._method_error(body)
+                return JSONResponse(response.model_dump(exclude_none=True), status_code=400)
+
+            request_model, handler_name = REQUEST_HANDLERS[method]
+            json_rpc_request = request_model.model_validate(body)
+            result = await getattr(self.task_manager, handler_name)(json_rpc_request)
 
             return self._create_response(result)
 
         except Exception as e:
             return self._handle_exception(e)
 
-    def _handle_exception(self, e: Exception) -> JSONResponse:
+    async def _process_batch(self, batch: list) -> Response:
+        """JSON-RPC 2.0 批量请求，批内的各个请求并发执行，按原顺序返回一个数组
+
+        通知（没有 id 的请求）照常执行但不返回响应；全是通知时返回 204。
+        """
+        if not batch:
+            response = JSONRPCResponse(id=None, error=InvalidRequestError(data="Empty batch"))
+            return JSONResponse(response.model_dump(exclude_none=True), status_code=400)
+
+        responses = await asyncio.gather(
+            *(self._process_batch_member(body) for body in batch)
+        )
+        responses = [r for r in responses if r is not None]
+        if not responses:
+            return Response(status_code=204)
+        content = "[" + ",".join(
+            r.model_dump_json(exclude_none=True) for r in responses
+        ) + "]"
+        return Response(content, media_type="application/json")
+
+    async def _process_batch_member(self, body: Any) -> JSONRPCResponse | None:
+        response = await self._run_batch_member(body)
+        # 合法的通知（有 method 没有 id）不回复，出错也不回复；无法识别的成员仍返回 id 为 null 的错误
+        if isinstance(body, dict) and "method" in body and "id" not in body:
+            return None
+        return response
+
+    async def _run_batch_member(self, body: Any) -> JSONRPCResponse:
+        method = body.get("method") if isinstance(body, dict) else None
+        if method not in REQUEST_HANDLERS:
+            return self._method_error(body)
+        request_id = body.get("id")
+        if method not in BATCH_METHODS:
+            return JSONRPCResponse(
+                id=request_id,
+                error=InvalidRequestError(data=f"{method} is not allowed in a batch"),
+            )
+
+        try:
+            request_model, handler_name = REQUEST_HANDLERS[method]
+            json_rpc_request = request_model.model_validate(body)
+            return await getattr(self.task_manager, handler_name)(json_rpc_request)
+        except Exception as e:
+            return JSONRPCResponse(id=request_id, error=self._exception_to_error(e))
+
+    def _method_error(self, body: Any) -> JSONRPCResponse:
+        if not isinstance(body, dict) or "method" not in body:
+            json_rpc_error = InvalidRequestError(data="Missing JSON-RPC method")
+        else:
+            logger.warning(f"Unexpected request method: {body.get('method')}")
+            json_rpc_error = MethodNotFoundError()
+        request_id = body.get("id") if isinstance(body, dict) else None
+        return JSONRPCResponse(id=request_id, error=json_rpc_error)
+
+    def _exception_to_error(self, e: Exception) -> JSONRPCError:
         if isinstance(e, json.decoder.JSONDecodeError):
-            json_rpc_error = JSONParseError()
+            return JSONParseError()
         elif isinstance(e, ValidationError):
-            json_rpc_error = InvalidRequestError(data=json.loads(e.json()))
+            return InvalidRequestError(data=json.loads(e.json()))
         else:
             logger.error(f"Unhandled exception: {e}")
-            json_rpc_error = InternalError()
+            return InternalError()
 
+    def _handle_exception(self, e: Exception) -> JSONResponse:
+        json_rpc_error = self._exception_to_error(e)
         response = JSONRPCResponse(id=None, error=json_rpc_error)
         return JSONResponse(response.model_dump(exclude_none=True), status_code=400)
 
@@ -122,7 +275,11 @@ class A2AServer:
 
             return EventSourceResponse(event_generator(result))
         elif isinstance(result, JSONRPCResponse):
-            return JSONResponse(result.model_dump(exclude_none=True))
+            # 直接用 pydantic-core 序列化成 JSON，省掉 model_dump + json.dumps 两步
+            return Response(
+                result.model_dump_json(exclude_none=True),
+                media_type="application/json",
+            )
         else:
             logger.error(f"Unexpected result type: {type(result)}")
             raise ValueError(f"Unexpected result type: {type(result)}")
@@ -0,0 +1,160 @@
+"""Bounded subscriber queues and replay buffers for SSE task events."""
+
+import asyncio
+from collections import deque
+
+from A2AServer.common.A2Atypes import (
+    TaskArtifactUpdateEvent,
+    TaskStatusUpdateEvent,
+    TaskState,
+    TextPart,
+    InternalError,
+    JSONRPCError,
+)
+
+OVERFLOW_POLICIES = ("disconnect", "drop_oldest")
+
+
+def _text_only(event: TaskArtifactUpdateEvent) -> bool:
+    return all(isinstance(part, TextPart) for part in event.artifact.parts)
+
+
+def _is_plain_working_status(event) -> bool:
+    return (
+        isinstance(event, TaskStatusUpdateEvent)
+        and not event.final
+        and event.status.state == TaskState.WORKING
+        and event.status.message is None
+    )
+
+
+class SubscriberQueue:
+    """A bounded queue of task events for one SSE subscriber.
+
+    While the subscriber lags behind, adjacent text chunks of the same
+    artifact are merged into one event and consecutive ``working`` status
+    events without a message keep only the latest one. When the queue is
+    still full, ``overflow`` decides what happens: ``disconnect`` ends the
+    stream with an error, ``drop_oldest`` drops the oldest non-final event.
+    """
+
+    def __init__(self, maxsize: int = 256, overflow: str = "disconnect"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.coalesced = 0
+        self.dropped = 0
+        self.disconnected = False
+        self._events = deque()
+        self._not_empty = asyncio.Event()
+
+    def qsize(self) -> int:
+        return len(self._events)
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._events),
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+        }
+
+    def put_nowait(self, event) -> None:
+        if self.disconnected:
+            return
+        if self._events and self._coalesce(event):
+            self.coalesced += 1
+            return
+        if self.maxsize > 0 and len(self._events) >= self.maxsize:
+            if not self._make_room():
+                return
+        self._events.append(event)
+        self._not_empty.set()
+
+    async def get(self):
+        while not self._events:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self._events.popleft()
+
+    def _coalesce(self, event) -> bool:
+        tail = self._events[-1]
+        if (
+            isinstance(event, TaskArtifactUpdateEvent)
+            and isinstance(tail, TaskArtifactUpdateEvent)
+            and event.artifact.append
+            and event.artifact.index == tail.artifact.index
+            and _text_only(event)
+            and _text_only(tail)
+        ):
+            text = "".join(part.text for part in tail.artifact.parts) + "".join(
+                part.text for part in event.artifact.parts
+            )
+            artifact = tail.artifact.model_copy(
+                update={
+                    "parts": [TextPart(text=text)],
+                    "lastChunk": event.artifact.lastChunk,
+                }
+            )
+            self._events[-1] = tail.model_copy(
+                update={"artifact": artifact, "metadata": event.metadata}
+            )
+            return True
+        if _is_plain_working_status(event) and _is_plain_working_status(tail):
+            self._events[-1] = event
+            return True
+        return False
+
+    def _make_room(self) -> bool:
+        if self.overflow == "drop_oldest":
+            for i, queued in enumerate(self._events):
+                if not (isinstance(queued, TaskStatusUpdateEvent) and queued.final) and not isinstance(
+                    queued, JSONRPCError
+                ):
+                    del self._events[i]
+                    self.dropped += 1
+                    return True
+
+        # 客户端消费太慢，丢掉积压的事件并以错误结束这个订阅
+        self.dropped += len(self._events) + 1
+        self._events.clear()
+        self._events.append(
+            InternalError(message="SSE subscriber is too slow and was disconnected")
+        )
+        self.disconnected = True
+        self._not_empty.set()
+        return False
+
+
+class EventReplayBuffer:
+    """Ring buffer of the last ``maxlen`` events a task emitted.
+
+    Every event gets a sequence number in ``metadata["seq"]`` so that a
+    client can resubscribe from the first sequence number it has not seen.
+    """
+
+    def __init__(self, maxlen: int = 256):
+        self.next_seq = 0
+        self.final = False
+        self._events = deque(maxlen=maxlen)
+
+    def append(self, event):
+        if not isinstance(event, JSONRPCError):
+            event.metadata = {**(event.metadata or {}), "seq": self.next_seq}
+        self._events.append((self.next_seq, event))
+        self.next_seq += 1
+        if isinstance(event, JSONRPCError) or (
+            isinstance(event, TaskStatusUpdateEvent) and event.final
+        ):
+            self.final = True
+        return event
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number of the oldest buffered event; ``next_seq`` when empty."""
+        return self._events[0][0] if self._events else self.next_seq
+
+    def events_from(self, offset: int) -> list:
+        """Events with a sequence number >= ``offset`` that are still buffered."""
+        return [event for seq, event in self._events if seq >= offset]
@@ -10,6 +10,7 @@ from A2AServer.common.A2Atypes import (
     SendTaskRequest,
     CancelTaskRequest,
     TaskNotCancelableError,
+    UnsupportedOperationError,
     SetTaskPushNotificationRequest,
     GetTaskPushNotificationRequest,
     GetTaskResponse,
@@ -30,14 +31,46 @@ from A2AServer.common.A2Atypes import (
     JSONRPCError,
     TaskPushNotificationConfig,
     InternalError,
+    InvalidParamsError,
 )
-from A2AServer.common.server.utils import new_not_implemented_error
+from A2AServer.common.server.task_store import TaskStore, InMemoryTaskStore, TERMINAL_STATES
+from A2AServer.common.server.utils import merge_artifacts
+from A2AServer.common.server.sse_queue import SubscriberQueue, EventReplayBuffer
+from collections import deque
 import asyncio
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+# 多进程时记录在 Task.metadata 里，接收这个任务的 worker 进程
+WORKER_PID_KEY = "worker_pid"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
 class TaskManager(ABC):
+    # 服务的进程数，A2AServer 以多进程启动时设置。任务状态在进程间共享，
+    # 但正在执行的任务和 SSE 事件只在执行它的进程里
+    workers: int = 1
+
+    async def warmup(self) -> None:
+        """Prepare the agent before the server accepts requests. Called once at startup."""
+        pass
+
+    def is_ready(self) -> bool:
+        """Whether the agent can serve requests without further initialization."""
+        return True
+
     @abstractmethod
     async def on_get_task(self, request: GetTaskRequest) -> GetTaskResponse:
         pass
@@ -76,25 +109,48 @@ class TaskManager(ABC):
 
 
 class InMemoryTaskManager(TaskManager):
-    def __init__(self):
-        self.tasks: dict[str, Task] = {}
-        self.push_notification_infos: dict[str, PushNotificationConfig] = {}
-        self.lock = asyncio.Lock()
-        self.task_sse_subscribers: dict[str, List[asyncio.Queue]] = {}
-        self.subscriber_lock = asyncio.Lock()
+    def __init__(
+        self,
+        task_store: TaskStore | None = None,
+        lock_stripes: int = 64,
+        sse_queue_size: int = 256,
+        sse_overflow: str = "disconnect",
+        replay_buffer_size: int = 256,
+        replay_finished_tasks: int = 64,
+        cancel_timeout: float = 0.1,
+    ):
+        self.task_store = task_store or InMemoryTaskStore()
+        # 按 task_id 分段加锁，只有同一个任务（或同一段）的写操作互相等待
+        self.task_locks = [asyncio.Lock() for _ in range(lock_stripes)]
+        self.task_sse_subscribers: dict[str, List[SubscriberQueue]] = {}
+        self.sse_queue_size = sse_queue_size
+        self.sse_overflow = sse_overflow
+        # 每个任务最近发出的事件，供 tasks/resubscribe 重放；已结束的只保留最近 replay_finished_tasks 个，
+        # 任务被任务存储淘汰或过期时一起释放。事件按 token 记录，一个满的缓冲区可能有几 MB
+        self.task_event_buffers: dict[str, EventReplayBuffer] = {}
+        self.replay_buffer_size = replay_buffer_size
+        self.replay_finished_tasks = replay_finished_tasks
+        self._finished_event_buffers = deque()
+        self.task_store.add_eviction_listener(self._on_task_evicted)
+        # 正在执行的任务，tasks/cancel 通过取消它来停止 agent
+        self.running_tasks: dict[str, asyncio.Task] = {}
+        self.cancel_timeout = cancel_timeout
+
+    def task_lock(self, task_id: str) -> asyncio.Lock:
+        return self.task_locks[hash(task_id) % len(self.task_locks)]
 
     async def on_get_task(self, request: GetTaskRequest) -> GetTaskResponse:
         logger.info(f"Getting task {request.params.id}")
         task_query_params: TaskQueryParams = request.params
 
-        async with self.lock:
-            task = self.tasks.get(task_query_params.id)
-            if task is None:
-                return GetTaskResponse(id=request.id, error=TaskNotFoundError())
+        # 读操作不加锁，返回的是任务的快照
+        task = await self.task_store.get_task(task_query_params.id)
+        if task is None:
+            return GetTaskResponse(id=request.id, error=TaskNotFoundError())
 
-            task_result = self.append_task_history(
-                task, task_query_params.historyLength
-            )
+        task_result = self.append_task_history(
+            task, task_query_params.historyLength
+        )
 
         return GetTaskResponse(id=request.id, result=task_result)
 
@@ -102,12 +158,73 @@ class InMemoryTaskManager(TaskManager):
         logger.info(f"Cancelling task {request.params.id}")
         task_id_params: TaskIdParams = request.params
 
-        async with self.lock:
-            task = self.tasks.get(task_id_params.id)
-            if task is None:
-                return CancelTaskResponse(id=request.id, error=TaskNotFoundError())
-
-        return CancelTaskResponse(id=request.id, error=TaskNotCancelableError())
+        task = await self.task_store.get_task(task_id_params.id)
+        if task is None:
+            return CancelTaskResponse(id=request.id, error=TaskNotFoundError())
+
+        runner = self.running_tasks.get(task_id_params.id)
+        if runner is None or runner.done():
+            if self._running_elsewhere(task):
+                return CancelTaskResponse(id=request.id, error=self._other_worker_error("canceled"))
+            if self._orphaned(task):
+                # 执行它的 worker 已经退出，任务不会再结束，直接标记为取消
+                logger.warning(f"Task {task_id_params.id} was left by an exited worker, marking it canceled")
+                task = await self.mark_task_canceled(task_id_params.id)
+                return CancelTaskResponse(id=request.id, result=self.append_task_history(task, 0))
+            return CancelTaskResponse(id=request.id, error=TaskNotCancelableError())
+
+        started = time.monotonic()
+        runner.cancel()
+        done, _ = await asyncio.wait({runner}, timeout=self.cancel_timeout)
+        latency_ms = (time.monotonic() - started) * 1000
+        if done:
+            logger.info(f"Task {task_id_params.id} canceled in {latency_ms:.1f} ms")
+        else:
+            logger.warning(
+                f"Task {task_id_params.id} did not stop within {self.cancel_timeout}s, marking it canceled"
+            )
+        task = await self.mark_task_canceled(task_id_params.id)
+        return CancelTaskResponse(id=request.id, result=self.append_task_history(task, 0))
+
+    def _running_elsewhere(self, task: Task) -> bool:
+        """Whether an active task without a local runner may be executing in another worker process."""
+        if self.workers <= 1 or task.status.state not in (TaskState.SUBMITTED, TaskState.WORKING):
+            return False
+        owner = (task.metadata or {}).get(WORKER_PID_KEY)
+        return owner is None or (owner != os.getpid() and _pid_alive(owner))
+
+    def _orphaned(self, task: Task) -> bool:
+        """Whether an active task belongs to a worker process that has exited."""
+        if self.workers <= 1 or task.status.state not in (TaskState.SUBMITTED, TaskState.WORKING):
+            return False
+        owner = (task.metadata or {}).get(WORKER_PID_KEY)
+        return owner is not None and owner != os.getpid() and not _pid_alive(owner)
+
+    @staticmethod
+    def _other_worker_error(action: str) -> JSONRPCError:
+        return UnsupportedOperationError(
+            message=f"Task is running in another worker process and cannot be {action} from this one"
+        )
+
+    def register_running_task(self, task_id: str, runner: asyncio.Task):
+        """Track the asyncio task that executes ``task_id`` so it can be canceled."""
+        self.running_tasks[task_id] = runner
+
+        def _forget(_):
+            if self.running_tasks.get(task_id) is runner:
+                del self.running_tasks[task_id]
+
+        runner.add_done_callback(_forget)
+
+    async def mark_task_canceled(self, task_id: str) -> Task:
+        """Move the task to ``canceled`` and end its event stream."""
+        task = await self.task_store.get_task(task_id)
+        if task is not None and task.status.state == TaskState.CANCELED:
+            await self.finish_event_stream(task_id, task.status)
+            return task
+        task = await self.update_store(task_id, TaskStatus(state=TaskState.CANCELED), None)
+        await self.finish_event_stream(task_id, task.status)
+        return task
 
     @abstractmethod
     async def on_send_task(self, request: SendTaskRequest) -> SendTaskResponse:
@@ -120,28 +237,29 @@ class InMemoryTaskManager(TaskManager):
         pass
 
     async def set_push_notification_info(self, task_id: str, notification_config: PushNotificationConfig):
-        async with self.lock:
-            task = self.tasks.get(task_id)
+        async with self.task_lock(task_id):
+            task = await self.task_store.get_task(task_id)
             if task is None:
                 raise ValueError(f"Task not found for {task_id}")
 
-            self.push_notification_infos[task_id] = notification_config
+            await self.task_store.set_push_notification_info(task_id, notification_config)
 
         return
     
     async def get_push_notification_info(self, task_id: str) -> PushNotificationConfig:
-        async with self.lock:
-            task = self.tasks.get(task_id)
-            if task is None:
-                raise ValueError(f"Task not found for {task_id}")
-
-            return self.push_notification_infos[task_id]
+        task = await self.task_store.get_task(task_id)
+        if task is None:
+            raise ValueError(f"Task not found for {task_id}")
+
+        notification_info = await self.task_store.get_push_notification_info(task_id)
+        if notification_info is None:
+            raise KeyError(task_id)
+        return notification_info
             
         return
     
     async def has_push_notification_info(self, task_id: str) -> bool:
-        async with self.lock:
-            return task_id in self.push_notification_infos
+        return await self.task_store.get_push_notification_info(task_id) is not None
             
 
     async def on_set_task_push_notification(
@@ -184,8 +302,12 @@ class InMemoryTaskManager(TaskManager):
 
     async def upsert_task(self, task_send_params: TaskSendParams) -> Task:
         logger.info(f"Upserting task {task_send_params.id}")
-        async with self.lock:
-            task = self.tasks.get(task_send_params.id)
+        async with self.task_lock(task_send_params.id):
+            def apply(task: Task):
+                task.history.append(task_send_params.message)
+                self._claim(task)
+
+            task = await self.task_store.update_task(task_send_params.id, apply)
             if task is None:
                 task = Task(
                     id=task_send_params.id,
@@ -194,41 +316,126 @@ class InMemoryTaskManager(TaskManager):
                     status=TaskStatus(state=TaskState.SUBMITTED),
                     history=[task_send_params.message],
                 )
-                self.tasks[task_send_params.id] = task
-            else:
-                task.history.append(task_send_params.message)
-
+                self._claim(task)
+                await self.task_store.save_task(task)
             return task
 
+    def _claim(self, task: Task):
+        """Record this worker process as the one running ``task``."""
+        if self.workers > 1:
+            task.metadata = {**(task.metadata or {}), WORKER_PID_KEY: os.getpid()}
+
     async def on_resubscribe_to_task(
         self, request: TaskResubscriptionRequest
     ) -> Union[AsyncIterable[SendTaskStreamingResponse], JSONRPCResponse]:
-        return new_not_implemented_error(request.id)
+        """Replay buffered events from ``params.metadata["offset"]``, then follow the live stream.
+
+        When the oldest buffered event is newer than ``offset``, the skipped
+        events are reported by a first, non-final status event whose metadata
+        holds ``missed_from``/``missed_to``; the client should re-read the
+        task with tasks/get.
+        """
+        task_id = request.params.id
+        offset = (request.params.metadata or {}).get("offset", 0)
+        if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+            return JSONRPCResponse(
+                id=request.id,
+                error=InvalidParamsError(data="metadata.offset must be a non-negative integer"),
+            )
+        logger.info(f"Resubscribing to task {task_id} from offset {offset}")
+
+        buffer = self.task_event_buffers.get(task_id)
+        if buffer is None:
+            task = await self.task_store.get_task(task_id)
+            if task is None:
+                return JSONRPCResponse(id=request.id, error=TaskNotFoundError())
+            if self._running_elsewhere(task):
+                return JSONRPCResponse(id=request.id, error=self._other_worker_error("resubscribed"))
+            if task.status.state not in TERMINAL_STATES:
+                # 没有事件流的任务（例如 tasks/send 发起的）不能订阅，也不能假装已经结束
+                return JSONRPCResponse(
+                    id=request.id,
+                    error=UnsupportedOperationError(
+                        message=f"Task is {task.status.state.value} and has no event stream to resubscribe to"
+                    ),
+                )
+            # 已结束的任务没有可以重放的事件，把最终状态作为最后一个事件返回
+            final_event = TaskStatusUpdateEvent(id=task_id, status=task.status, final=True)
+            return self._replay_events(request.id, task_id, [final_event], None)
+
+        status = None
+        if offset < buffer.first_seq:
+            task = await self.task_store.get_task(task_id)
+            status = task.status if task is not None else TaskStatus(state=TaskState.UNKNOWN)
+            buffer = self.task_event_buffers.get(task_id, buffer)
+
+        # 从这里到挂上订阅队列之间没有 await，不会漏掉事件
+        events = []
+        if status is not None and offset < buffer.first_seq:
+            # 请求的事件已经被挤出了重放缓冲区，告诉客户端漏掉了哪些
+            events.append(TaskStatusUpdateEvent(
+                id=task_id,
+                status=status,
+                final=False,
+                metadata={"missed_from": offset, "missed_to": buffer.first_seq - 1},
+            ))
+
+        if buffer.final:
+            return self._replay_events(request.id, task_id, events + buffer.events_from(offset), None)
+
+        sse_event_queue = await self.setup_sse_consumer(task_id)
+        return self._replay_events(
+            request.id, task_id, events + buffer.events_from(offset), sse_event_queue
+        )
+
+    async def _replay_events(
+        self, request_id, task_id, events: list, sse_event_queue: SubscriberQueue | None
+    ) -> AsyncIterable[SendTaskStreamingResponse]:
+        try:
+            for event in events:
+                if isinstance(event, JSONRPCError):
+                    yield SendTaskStreamingResponse(id=request_id, error=event)
+                else:
+                    yield SendTaskStreamingResponse(id=request_id, result=event)
+            if sse_event_queue is not None:
+                async for response in self.dequeue_events_for_sse(
+                    request_id, task_id, sse_event_queue
+                ):
+                    yield response
+        finally:
+            if sse_event_queue is not None:
+                self._remove_sse_consumer(task_id, sse_event_queue)
 
     async def update_store(
         self, task_id: str, status: TaskStatus, artifacts: list[Artifact]
     ) -> Task:
-        async with self.lock:
-            try:
-                task = self.tasks[task_id]
-            except KeyError:
-                logger.error(f"Task {task_id} not found for updating the task")
-                raise ValueError(f"Task {task_id} not found")
-
+        def apply(task: Task):
             task.status = status
 
             if status.message is not None:
                 task.history.append(status.message)
 
-            if artifacts is not None:
-                if task.artifacts is None:
-                    task.artifacts = []
-                task.artifacts.extend(artifacts)
+            if artifacts:
+                # 追加的分块合并到同一个 index 的 artifact 里，不按 token 保存
+                task.artifacts = merge_artifacts(task.artifacts or [], artifacts)
 
-            return task
+        # 读-改-写由任务存储完成，多进程共享的存储在一个事务里完成，不会覆盖其它进程的更新；
+        # 这样的存储不需要再加锁，加锁只会让同一段的任务排队等数据库
+        if self.task_store.atomic_updates:
+            task = await self.task_store.update_task(task_id, apply)
+        else:
+            async with self.task_lock(task_id):
+                task = await self.task_store.update_task(task_id, apply)
+        if task is None:
+            logger.error(f"Task {task_id} not found for updating the task")
+            raise ValueError(f"Task {task_id} not found")
+        return task
 
     def append_task_history(self, task: Task, historyLength: int | None):
         new_task = task.model_copy()
+        # 复制会被原地修改的列表，调用方拿到的是不可变的快照
+        if task.artifacts is not None:
+            new_task.artifacts = list(task.artifacts)
         if historyLength is not None and historyLength > 0:
             new_task.history = new_task.history[-historyLength:]
         else:
@@ -236,29 +443,52 @@ class InMemoryTaskManager(TaskManager):
 
         return new_task        
 
+    # 订阅者的增删和分发中间没有 await，在事件循环里天然是原子的，不需要全局锁
     async def setup_sse_consumer(self, task_id: str, is_resubscribe: bool = False):
-        async with self.subscriber_lock:
-            if task_id not in self.task_sse_subscribers:
-                if is_resubscribe:
-                    raise ValueError("Task not found for resubscription")
-                else:
-                    self.task_sse_subscribers[task_id] = []
-
-            sse_event_queue = asyncio.Queue(maxsize=0) # <=0 is unlimited
-            self.task_sse_subscribers[task_id].append(sse_event_queue)
-            return sse_event_queue
+        if task_id not in self.task_sse_subscribers:
+            if is_resubscribe:
+                raise ValueError("Task not found for resubscription")
+            else:
+                self.task_sse_subscribers[task_id] = []
+
+        sse_event_queue = SubscriberQueue(maxsize=self.sse_queue_size, overflow=self.sse_overflow)
+        self.task_sse_subscribers[task_id].append(sse_event_queue)
+        return sse_event_queue
+
+    def get_sse_stats(self, task_id: str) -> list[dict]:
+        """Queue depth and coalesce/drop counters of every subscriber of a task."""
+        return [queue.stats() for queue in self.task_sse_subscribers.get(task_id, [])]
+
+    def reset_event_stream(self, task_id: str):
+        """Forget the buffered events of a task before it starts a new run."""
+        self.task_event_buffers.pop(task_id, None)
+
+    async def finish_event_stream(self, task_id: str, status: TaskStatus):
+        """Send a final status event if the task's stream ended without one."""
+        buffer = self.task_event_buffers.get(task_id)
+        if buffer is not None and not buffer.final:
+            await self.enqueue_events_for_sse(
+                task_id, TaskStatusUpdateEvent(id=task_id, status=status, final=True)
+            )
 
     async def enqueue_events_for_sse(self, task_id, task_update_event):
-        async with self.subscriber_lock:
-            if task_id not in self.task_sse_subscribers:
-                return
+        buffer = self.task_event_buffers.get(task_id)
+        if buffer is None:
+            buffer = self.task_event_buffers[task_id] = EventReplayBuffer(self.replay_buffer_size)
+        was_final = buffer.final
+        buffer.append(task_update_event)
+        if buffer.final and not was_final:
+            self._retire_event_buffer(task_id)
+
+        current_subscribers = self.task_sse_subscribers.get(task_id)
+        if not current_subscribers:
+            return
 
-            current_subscribers = self.task_sse_subscribers[task_id]
-            for subscriber in current_subscribers:
-                await subscriber.put(task_update_event)
+        for subscriber in list(current_subscribers):
+            subscriber.put_nowait(task_update_event)
 
     async def dequeue_events_for_sse(
-        self, request_id, task_id, sse_event_queue: asyncio.Queue
+        self, request_id, task_id, sse_event_queue: SubscriberQueue
     ) -> AsyncIterable[SendTaskStreamingResponse] | JSONRPCResponse:
         try:
             while True:                
@@ -271,7 +501,29 @@ class InMemoryTaskManager(TaskManager):
                 if isinstance(event, TaskStatusUpdateEvent) and event.final:
                     break
         finally:
-            async with self.subscriber_lock:
-                if task_id in self.task_sse_subscribers:
-                    self.task_sse_subscribers[task_id].remove(sse_event_queue)
+            self._remove_sse_consumer(task_id, sse_event_queue)
+
+    def _remove_sse_consumer(self, task_id: str, sse_event_queue: SubscriberQueue):
+        subscribers = self.task_sse_subscribers.get(task_id)
+        if subscribers is not None and sse_event_queue in subscribers:
+            subscribers.remove(sse_event_queue)
+            if not subscribers:
+                # 最后一个订阅者离开后不再保留这个任务的空列表
+                del self.task_sse_subscribers[task_id]
+
+    def _on_task_evicted(self, task_id: str):
+        """Release what the manager keeps for a task the store no longer holds."""
+        # 只有已结束的任务会被淘汰，它的订阅者都已经收到了结束事件
+        self.task_sse_subscribers.pop(task_id, None)
+        buffer = self.task_event_buffers.get(task_id)
+        if buffer is not None and buffer.final:
+            del self.task_event_buffers[task_id]
+
+    def _retire_event_buffer(self, task_id: str):
+        self._finished_event_buffers.append(task_id)
+        while len(self._finished_event_buffers) > self.replay_finished_tasks:
+            old_task_id = self._finished_event_buffers.popleft()
+            old_buffer = self.task_event_buffers.get(old_task_id)
+            if old_buffer is not None and old_buffer.final:
+                del self.task_event_buffers[old_task_id]
 
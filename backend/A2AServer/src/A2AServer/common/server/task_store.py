@@ -0,0 +1,488 @@
+"""Task storage backends used by InMemoryTaskManager."""
+
+import asyncio
+import os
+import sqlite3
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable
+
+from A2AServer.common.A2Atypes import Task, TaskState, PushNotificationConfig
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = {TaskState.COMPLETED, TaskState.FAILED, TaskState.CANCELED}
+
+
+class TaskStore(ABC):
+    """Storage for tasks and their push-notification configs.
+
+    ``shared_across_processes`` tells the server whether several worker
+    processes can safely use the same store.
+    """
+
+    shared_across_processes: bool = False
+    _eviction_listeners: tuple = ()
+
+    @property
+    def atomic_updates(self) -> bool:
+        """Whether ``update_task`` is atomic on its own, without a lock in the caller."""
+        return False
+
+    def add_eviction_listener(self, listener: Callable[[str], None]) -> None:
+        """Call ``listener(task_id)`` whenever the store drops a task from memory."""
+        self._eviction_listeners = (*self._eviction_listeners, listener)
+
+    def _notify_evicted(self, task_id: str) -> None:
+        for listener in self._eviction_listeners:
+            listener(task_id)
+
+    @abstractmethod
+    async def get_task(self, task_id: str) -> Task | None:
+        pass
+
+    @abstractmethod
+    async def save_task(self, task: Task) -> None:
+        pass
+
+    async def update_task(self, task_id: str, mutate: Callable[[Task], None]) -> Task | None:
+        """Apply ``mutate`` to the stored task and save it; None when there is no such task.
+
+        Stores shared across processes override this to make the
+        read-modify-write atomic with respect to other processes.
+        """
+        task = await self.get_task(task_id)
+        if task is None:
+            return None
+        mutate(task)
+        await self.save_task(task)
+        return task
+
+    @abstractmethod
+    async def get_session_tasks(self, session_id: str) -> list[Task]:
+        pass
+
+    @abstractmethod
+    async def get_push_notification_info(
+        self, task_id: str
+    ) -> PushNotificationConfig | None:
+        pass
+
+    @abstractmethod
+    async def set_push_notification_info(
+        self, task_id: str, notification_config: PushNotificationConfig
+    ) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class InMemoryTaskStore(TaskStore):
+    """Keeps tasks in process-local dicts.
+
+    Retention of finished (completed/failed/canceled) tasks is bounded by
+    ``max_tasks``, ``max_bytes`` (estimated from the serialized task size) and
+    ``terminal_ttl`` seconds since the task was last read or written. Finished
+    tasks are evicted least recently used first; tasks that are still running
+    are never evicted. Evicted tasks are written to ``fallback`` when one is
+    given and are read back from it on a miss, otherwise they are gone.
+    Expired tasks are removed by a background sweeper that handles at most
+    ``sweep_batch`` tasks at a time.
+    """
+
+    def __init__(
+        self,
+        max_tasks: int | None = None,
+        max_bytes: int | None = None,
+        terminal_ttl: float | None = None,
+        fallback: TaskStore | None = None,
+        sweep_interval: float = 1.0,
+        sweep_batch: int = 100,
+    ):
+        self.tasks: dict[str, Task] = {}
+        self.push_notification_infos: dict[str, PushNotificationConfig] = {}
+        self.max_tasks = max_tasks
+        self.max_bytes = max_bytes
+        self.terminal_ttl = terminal_ttl
+        self.fallback = fallback
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        # 已结束任务按最近访问排序: task_id -> 最近访问时间，最前面的最久未使用
+        self._terminal: OrderedDict[str, float] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._total_bytes = 0
+        self._sweep_task: asyncio.Task | None = None
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get_task(self, task_id: str) -> Task | None:
+        task = self.tasks.get(task_id)
+        if task is None:
+            if self.fallback is not None:
+                return await self.fallback.get_task(task_id)
+            return None
+        if task_id in self._terminal:
+            self._terminal[task_id] = time.monotonic()
+            self._terminal.move_to_end(task_id)
+        return task
+
+    async def save_task(self, task: Task) -> None:
+        self.tasks[task.id] = task
+        if self.max_bytes is not None:
+            # 只有设置了 max_bytes 才需要序列化估算大小，历史很长的任务序列化开销不小
+            size = len(task.model_dump_json())
+            self._total_bytes += size - self._sizes.get(task.id, 0)
+            self._sizes[task.id] = size
+
+        if task.status.state in TERMINAL_STATES:
+            self._terminal[task.id] = time.monotonic()
+            self._terminal.move_to_end(task.id)
+        else:
+            self._terminal.pop(task.id, None)
+
+        await self._enforce_limits()
+        if self.terminal_ttl is not None:
+            self._ensure_sweeper()
+
+    async def get_session_tasks(self, session_id: str) -> list[Task]:
+        tasks = {task.id: task for task in self.tasks.values() if task.sessionId == session_id}
+        if self.fallback is not None:
+            for task in await self.fallback.get_session_tasks(session_id):
+                tasks.setdefault(task.id, task)
+        return list(tasks.values())
+
+    async def get_push_notification_info(
+        self, task_id: str
+    ) -> PushNotificationConfig | None:
+        info = self.push_notification_infos.get(task_id)
+        if info is None and task_id not in self.tasks and self.fallback is not None:
+            return await self.fallback.get_push_notification_info(task_id)
+        return info
+
+    async def set_push_notification_info(
+        self, task_id: str, notification_config: PushNotificationConfig
+    ) -> None:
+        self.push_notification_infos[task_id] = notification_config
+
+    def stats(self) -> dict:
+        """Current size of the store and how many tasks were removed."""
+        return {
+            "tasks": len(self.tasks),
+            "terminal_tasks": len(self._terminal),
+            # 没有设置 max_bytes 时不统计大小
+            "estimated_bytes": self._total_bytes if self.max_bytes is not None else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _over_limits(self) -> bool:
+        if self.max_tasks is not None and len(self.tasks) > self.max_tasks:
+            return True
+        if self.max_bytes is not None and self._total_bytes > self.max_bytes:
+            return True
+        return False
+
+    async def _enforce_limits(self):
+        while self._terminal and self._over_limits():
+            task_id, _ = self._terminal.popitem(last=False)
+            await self._evict(task_id)
+            self.evictions += 1
+
+    async def _evict(self, task_id: str):
+        task = self.tasks.pop(task_id)
+        self._total_bytes -= self._sizes.pop(task_id, 0)
+        notification_info = self.push_notification_infos.pop(task_id, None)
+        # 任务管理器据此释放这个任务的重放缓冲区等内存
+        self._notify_evicted(task_id)
+        if self.fallback is not None:
+            await self.fallback.save_task(task)
+            if notification_info is not None:
+                await self.fallback.set_push_notification_info(task_id, notification_info)
+
+    def _ensure_sweeper(self):
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Error while sweeping expired tasks: {e}")
+
+    async def sweep(self):
+        """Remove expired finished tasks, ``sweep_batch`` at a time."""
+        if self.terminal_ttl is None:
+            return
+        while self._terminal:
+            deadline = time.monotonic() - self.terminal_ttl
+            expired = []
+            for task_id, touched_at in self._terminal.items():
+                if touched_at > deadline or len(expired) >= self.sweep_batch:
+                    break
+                expired.append(task_id)
+            if not expired:
+                return
+            for task_id in expired:
+                del self._terminal[task_id]
+                await self._evict(task_id)
+                self.expirations += 1
+            # 每一批之后让出事件循环，不阻塞正在处理的请求
+            await asyncio.sleep(0)
+
+    async def close(self) -> None:
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+        if self.fallback is not None:
+            await self.fallback.close()
+
+
+class _SQLiteThread:
+    """One SQLite connection, used only from its own single worker thread.
+
+    Calls run in submission order. The connection and the thread are
+    reopened in a forked worker process, since neither survives a fork.
+    """
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        self._conn: sqlite3.Connection | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._pid: int | None = None
+
+    async def run(self, fn, *args):
+        """Run ``fn(connection, *args)`` in the thread."""
+        if self._pid != os.getpid():
+            self._conn = None
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+            self._pid = os.getpid()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, args)
+
+    def _call(self, fn, args):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id TEXT PRIMARY KEY, session_id TEXT, data TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_session_id ON tasks (session_id)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS push_notifications ("
+                "task_id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return fn(self._conn, *args)
+
+    async def close(self):
+        if self._executor is None or self._pid != os.getpid():
+            return
+        if self._conn is not None:
+            await self.run(lambda conn: conn.close())
+            self._conn = None
+        self._executor.shutdown()
+        self._executor = None
+        self._pid = None
+
+
+class SQLiteTaskStore(TaskStore):
+    """Stores tasks in a SQLite database in WAL mode.
+
+    Every worker process opens its own connection, so one database file can
+    back all workers of a multi-process A2AServer. ``update_task`` reads,
+    changes and writes a task in one ``BEGIN IMMEDIATE`` transaction, so two
+    workers updating the same task do not overwrite each other's history or
+    artifacts. Within a process all writes run in submission order on one
+    writer thread and reads on a separate reader connection, so a burst of
+    writes neither starves a single write nor blocks reads.
+
+    With ``flush_interval`` > 0 task writes are write-behind: ``save_task``
+    only records the task in memory and a background task writes all dirty
+    tasks in one transaction every ``flush_interval`` seconds, or as soon as
+    ``batch_size`` tasks are pending. Reads in the same process see pending
+    writes immediately; other processes see them after the next flush.
+    Updates are then no longer atomic across processes, so write-behind is
+    only safe with a single worker.
+    """
+
+    shared_across_processes = True
+
+    def __init__(self, path: str = "tasks.db", flush_interval: float = 0.0, batch_size: int = 100):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # 写入都在一个线程里按顺序执行；WAL 模式下读取用另一个连接，不用排在写入后面
+        self._writer = _SQLiteThread(path, "sqlite-task-writer")
+        self._reader = _SQLiteThread(path, "sqlite-task-reader")
+        self._pending: dict[str, Task] = {}
+        self._flushing: dict[str, Task] = {}
+        self._flush_task: asyncio.Task | None = None
+        self._flush_wakeup: asyncio.Event | None = None
+
+    @staticmethod
+    def _fetch_one(conn: sqlite3.Connection, sql: str, params: tuple):
+        return conn.execute(sql, params).fetchone()
+
+    @staticmethod
+    def _fetch_all(conn: sqlite3.Connection, sql: str, params: tuple):
+        return conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _execute(conn: sqlite3.Connection, sql: str, params: tuple):
+        conn.execute(sql, params)
+        conn.commit()
+
+    @staticmethod
+    def _execute_many(conn: sqlite3.Connection, sql: str, rows: list[tuple]):
+        conn.executemany(sql, rows)
+        conn.commit()
+
+    async def get_task(self, task_id: str) -> Task | None:
+        task = self._pending.get(task_id) or self._flushing.get(task_id)
+        if task is not None:
+            return task
+        row = await self._reader.run(
+            self._fetch_one, "SELECT data FROM tasks WHERE id = ?", (task_id,)
+        )
+        return None if row is None else Task.model_validate_json(row[0])
+
+    async def save_task(self, task: Task) -> None:
+        if self.flush_interval <= 0:
+            await self._write_tasks([task])
+            return
+
+        self._pending[task.id] = task
+        self._ensure_flusher()
+        if len(self._pending) >= self.batch_size:
+            self._flush_wakeup.set()
+
+    @property
+    def atomic_updates(self) -> bool:
+        return self.flush_interval <= 0
+
+    async def update_task(self, task_id: str, mutate: Callable[[Task], None]) -> Task | None:
+        if self.flush_interval > 0:
+            return await super().update_task(task_id, mutate)
+        return await self._writer.run(self._update_row, task_id, mutate)
+
+    @staticmethod
+    def _update_row(conn: sqlite3.Connection, task_id: str, mutate: Callable[[Task], None]) -> Task | None:
+        # 先拿到数据库的写锁，读-改-写期间其它进程不能写入，不会覆盖它们的更新
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            task = Task.model_validate_json(row[0])
+            mutate(task)
+            conn.execute(
+                "UPDATE tasks SET session_id = ?, data = ? WHERE id = ?",
+                (task.sessionId, task.model_dump_json(), task_id),
+            )
+            conn.commit()
+            return task
+        except BaseException:
+            conn.rollback()
+            raise
+
+    async def get_session_tasks(self, session_id: str) -> list[Task]:
+        rows = await self._reader.run(
+            self._fetch_all, "SELECT data FROM tasks WHERE session_id = ?", (session_id,)
+        )
+        tasks = {}
+        for (data,) in rows:
+            task = Task.model_validate_json(data)
+            tasks[task.id] = task
+        for task in [*self._flushing.values(), *self._pending.values()]:
+            if task.sessionId == session_id:
+                tasks[task.id] = task
+        return list(tasks.values())
+
+    async def _write_tasks(self, tasks: list[Task]) -> None:
+        # 在事件循环里序列化，避免线程里读到正在被修改的 Task
+        rows = [(task.id, task.sessionId, task.model_dump_json()) for task in tasks]
+        await self._writer.run(
+            self._execute_many,
+            "INSERT OR REPLACE INTO tasks (id, session_id, data) VALUES (?, ?, ?)",
+            rows,
+        )
+
+    def _ensure_flusher(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error while flushing tasks to {self.path}: {e}")
+
+    async def flush(self) -> None:
+        """Write every pending task to the database in one batch."""
+        if not self._pending:
+            return
+        # 写入过程中的任务放在 _flushing 里，读取时仍然可见
+        self._flushing, self._pending = self._pending, {}
+        try:
+            await self._write_tasks(list(self._flushing.values()))
+        except Exception:
+            # 写入失败时放回去，下次再刷，不覆盖期间更新过的任务
+            for task_id, task in self._flushing.items():
+                self._pending.setdefault(task_id, task)
+            raise
+        finally:
+            self._flushing = {}
+
+    async def get_push_notification_info(
+        self, task_id: str
+    ) -> PushNotificationConfig | None:
+        row = await self._reader.run(
+            self._fetch_one,
+            "SELECT data FROM push_notifications WHERE task_id = ?",
+            (task_id,),
+        )
+        return None if row is None else PushNotificationConfig.model_validate_json(row[0])
+
+    async def set_push_notification_info(
+        self, task_id: str, notification_config: PushNotificationConfig
+    ) -> None:
+        await self._writer.run(
+            self._execute,
+            "INSERT OR REPLACE INTO push_notifications (task_id, data) VALUES (?, ?)",
+            (task_id, notification_config.model_dump_json()),
+        )
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        await self._writer.close()
+        await self._reader.close()
@@ -2,8 +2,16 @@ from A2AServer.common.A2Atypes import (
     JSONRPCResponse,
     ContentTypeNotSupportedError,
     UnsupportedOperationError,
+    Artifact,
+    TextPart,
 )
 from typing import List
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，没有安装时回退到标准库
+    orjson = None
 
 
 def are_modalities_compatible(
@@ -26,3 +34,65 @@ def new_incompatible_types_error(request_id):
 
 def new_not_implemented_error(request_id):
     return JSONRPCResponse(id=request_id, error=UnsupportedOperationError())
+
+
+def json_loads(data: bytes | str):
+    """Decode a JSON payload, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class ArtifactAssembler:
+    """Merge streamed artifact chunks into one artifact per streamed artifact.
+
+    Text of consecutive append chunks is collected in a list and joined once
+    in ``artifacts()``, instead of keeping one Artifact per streamed token.
+    A chunk with ``append`` set is folded into the latest artifact with the
+    same index; any other chunk starts a new artifact, so artifacts from an
+    earlier run of the same task are kept.
+    """
+
+    def __init__(self):
+        # (第一个分块, 分段列表)，按出现的顺序；连续的文本放在同一个字符串列表里
+        self._entries: list[tuple[Artifact, list]] = []
+        # index -> 这个 index 最新的 artifact 在 _entries 里的位置
+        self._latest: dict[int, int] = {}
+
+    def add(self, artifact: Artifact):
+        position = self._latest.get(artifact.index)
+        if position is None or not artifact.append:
+            position = self._latest[artifact.index] = len(self._entries)
+            self._entries.append((artifact, []))
+        segments = self._entries[position][1]
+        for part in artifact.parts:
+            if isinstance(part, TextPart):
+                if segments and isinstance(segments[-1], list):
+                    segments[-1].append(part.text)
+                else:
+                    segments.append([part.text])
+            else:
+                segments.append(part)
+
+    def artifacts(self) -> List[Artifact]:
+        return [
+            first.model_copy(
+                update={
+                    "parts": [
+                        TextPart(text="".join(segment)) if isinstance(segment, list) else segment
+                        for segment in segments
+                    ],
+                    "append": None,
+                    "lastChunk": None,
+                }
+            )
+            for first, segments in self._entries
+        ]
+
+
+def merge_artifacts(existing: List[Artifact], new: List[Artifact]) -> List[Artifact]:
+    """Add ``new`` artifacts to ``existing``, folding append chunks into the artifact with the same index."""
+    assembler = ArtifactAssembler()
+    for artifact in [*existing, *new]:
+        assembler.add(artifact)
+    return assembler.artifacts()
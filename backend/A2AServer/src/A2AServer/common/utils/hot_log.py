@@ -0,0 +1,142 @@
+"""Logging helpers for per-token and per-event code paths.
+
+``HotPathLogger`` checks the level and a per-event-type sampling rate before
+anything is formatted, and only formats the message (``%``-style) when the
+record is actually emitted. ``setup_queued_logging`` moves the handlers of a
+logger behind a ``QueueHandler`` so writing to stdout or files happens on a
+background thread instead of the event loop.
+"""
+
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# 采样率的环境变量，例如 A2A_LOG_SAMPLE="artifact=0.01,status=0.1"
+SAMPLE_ENV = "A2A_LOG_SAMPLE"
+
+
+def parse_sample_rates(spec: str | None) -> dict[str, float]:
+    """Parse ``"event=rate,event=rate"`` into a dict of sampling rates."""
+    rates = {}
+    if not spec:
+        return rates
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        event, _, rate = item.partition("=")
+        try:
+            rates[event.strip()] = float(rate)
+        except ValueError:
+            raise ValueError(f"Invalid log sampling rate: {item}")
+    return rates
+
+
+class HotPathLogger:
+    """A level-gated, sampled wrapper around a ``logging.Logger``.
+
+    Every call names an event type. A rate of 1.0 logs every event of that
+    type, 0.01 logs one in a hundred and 0 none; types without a rate use
+    ``default_rate``. Rates not given explicitly are read from the
+    ``A2A_LOG_SAMPLE`` environment variable.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        sample_rates: dict[str, float] | None = None,
+        default_rate: float = 1.0,
+    ):
+        self.logger = logger
+        self.default_rate = default_rate
+        self.sample_rates = {**parse_sample_rates(os.environ.get(SAMPLE_ENV)), **(sample_rates or {})}
+        self._counters: dict[str, int] = {}
+
+    def set_rate(self, event: str, rate: float):
+        self.sample_rates[event] = rate
+
+    def enabled(self, event: str, level: int = logging.DEBUG) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        rate = self.sample_rates.get(event, self.default_rate)
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        # 按计数采样，每 1/rate 个事件记录一次，不需要随机数
+        count = self._counters.get(event, 0)
+        self._counters[event] = count + 1
+        return count % round(1 / rate) == 0
+
+    def log(self, level: int, event: str, msg: str, *args):
+        if self.enabled(event, level):
+            self.logger.log(level, msg, *args, extra={"event": event}, stacklevel=3)
+
+    def debug(self, event: str, msg: str, *args):
+        self.log(logging.DEBUG, event, msg, *args)
+
+    def info(self, event: str, msg: str, *args):
+        self.log(logging.INFO, event, msg, *args)
+
+
+# 当前进程的 (logger, QueueHandler, 原来的 handlers, QueueListener)
+_queued: tuple | None = None
+_hooks_registered = False
+
+
+def setup_queued_logging(logger: logging.Logger | None = None) -> QueueListener | None:
+    """Move the handlers of ``logger`` (root by default) to a background thread.
+
+    Returns the started listener, or None when the logger has no handlers or
+    is already queued. The listener is stopped at interpreter exit. Threads do
+    not survive ``fork``, so a forked child (e.g. a multi-worker A2AServer)
+    starts its own listener on a fresh queue; it should call
+    ``stop_queued_logging`` before it exits because forked children skip
+    atexit.
+    """
+    global _queued, _hooks_registered
+    logger = logger or logging.getLogger()
+    handlers = [handler for handler in logger.handlers if not isinstance(handler, QueueHandler)]
+    if not handlers or len(handlers) != len(logger.handlers):
+        return None
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    listener = _start_listener(queue_handler, handlers)
+    _queued = (logger, queue_handler, handlers, listener)
+    if not _hooks_registered:
+        _hooks_registered = True
+        os.register_at_fork(after_in_child=_restart_in_child)
+        atexit.register(stop_queued_logging)
+    return listener
+
+
+def stop_queued_logging() -> None:
+    """Drain the queue and put the original handlers of the logger back."""
+    global _queued
+    if _queued is None:
+        return
+    logger, queue_handler, handlers, listener = _queued
+    _queued = None
+    listener.stop()
+    logger.removeHandler(queue_handler)
+    for handler in handlers:
+        logger.addHandler(handler)
+
+
+def _start_listener(queue_handler: QueueHandler, handlers: list) -> QueueListener:
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def _restart_in_child():
+    # 父进程的 listener 线程不会被 fork 到子进程，换一个新队列并在子进程里重新启动
+    global _queued
+    if _queued is None:
+        return
+    logger, queue_handler, handlers, _ = _queued
+    queue_handler.queue = queue.SimpleQueue()
+    _queued = (logger, queue_handler, handlers, _start_listener(queue_handler, handlers))
@@ -0,0 +1,208 @@
+"""Token-budgeted context window management for BasicAgent."""
+
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_TOKENS = 32000
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+# 超出预算时较早的工具结果被替换成的内容
+ELIDED_TOOL_RESULT = "[较早的工具结果已省略]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about one token per CJK character, four characters per token otherwise."""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff" or "\u3000" <= ch <= "\u30ff")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    content = message.get("content")
+    if isinstance(content, str):
+        tokens += estimate_tokens(content)
+    elif content:
+        tokens += estimate_tokens(json.dumps(content, ensure_ascii=False))
+    for tc in message.get("tool_calls") or []:
+        function = tc.get("function", {})
+        tokens += estimate_tokens(function.get("name", "")) + estimate_tokens(str(function.get("arguments", "")))
+    return tokens
+
+
+class ContextManager:
+    """Keeps a conversation within a token budget before it is sent to the model.
+
+    The system prompt, the latest user message and the latest batch of tool
+    results are always kept. When the conversation is over ``max_tokens``,
+    these steps run in order, each oldest first, until it fits:
+
+    1. older tool results are truncated to ``tool_result_chars`` characters;
+    2. older tool results are replaced by a short placeholder;
+    3. whole turns before the latest user message are dropped; with a
+       ``summarizer`` they are replaced by a system message holding the
+       summary;
+    4. older tool call batches of the current turn (the assistant message
+       with ``tool_calls`` and its tool results) are dropped together.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = DEFAULT_CONTEXT_TOKENS,
+        tool_result_chars: int = 1000,
+        summarizer: Optional[Callable[[List[Dict]], Awaitable[str]]] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.tool_result_chars = tool_result_chars
+        self.summarizer = summarizer
+        self.iterations = 0
+        self.prompt_tokens_total = 0
+        self.prompt_tokens_max = 0
+        self.last_prompt_tokens = 0
+        self.truncated = 0
+        self.elided = 0
+        self.dropped = 0
+        # 模型服务返回的实际用量，cached_tokens 是命中前缀缓存的 prompt token 数
+        self.provider_prompt_tokens = 0
+        self.cached_tokens = 0
+
+    async def fit(self, conversation: List[Dict]) -> int:
+        """Trim ``conversation`` in place to the budget and return its estimated token count."""
+        tokens = [message_tokens(message) for message in conversation]
+        total = sum(tokens)
+        if total > self.max_tokens:
+            total = self._truncate_tool_results(conversation, tokens, total)
+        if total > self.max_tokens:
+            total = self._elide_tool_results(conversation, tokens, total)
+        if total > self.max_tokens:
+            total = await self._drop_old_turns(conversation, tokens, total)
+        if total > self.max_tokens:
+            total = self._drop_tool_batches(conversation, tokens, total)
+        if total > self.max_tokens:
+            logger.warning(f"Conversation still has ~{total} tokens after trimming, budget is {self.max_tokens}")
+
+        self.iterations += 1
+        self.prompt_tokens_total += total
+        self.prompt_tokens_max = max(self.prompt_tokens_max, total)
+        self.last_prompt_tokens = total
+        return total
+
+    def record_usage(self, usage: Dict):
+        """Add the token usage a provider reported for one model call."""
+        self.provider_prompt_tokens += usage.get("prompt_tokens", 0)
+        self.cached_tokens += usage.get("cached_tokens", 0)
+
+    def stats(self) -> Dict:
+        return {
+            "iterations": self.iterations,
+            "prompt_tokens_last": self.last_prompt_tokens,
+            "prompt_tokens_avg": self.prompt_tokens_total / self.iterations if self.iterations else 0,
+            "prompt_tokens_max": self.prompt_tokens_max,
+            "truncated_tool_results": self.truncated,
+            "elided_tool_results": self.elided,
+            "dropped_messages": self.dropped,
+            "provider_prompt_tokens": self.provider_prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cache_hit_rate": self.cached_tokens / self.provider_prompt_tokens if self.provider_prompt_tokens else 0.0,
+        }
+
+    def _protected_from(self, conversation: List[Dict]) -> int:
+        """Index of the latest tool batch (or the latest message); later messages are never trimmed."""
+        for i in range(len(conversation) - 1, 0, -1):
+            if conversation[i]["role"] != "tool":
+                return i + 1 if conversation[i].get("tool_calls") else len(conversation)
+        return len(conversation)
+
+    def _truncate_tool_results(self, conversation: List[Dict], tokens: List[int], total: int) -> int:
+        limit = self.tool_result_chars
+        for i in range(1, self._protected_from(conversation)):
+            if total <= self.max_tokens:
+                break
+            message = conversation[i]
+            content = message.get("content")
+            if message["role"] != "tool" or not isinstance(content, str) or len(content) <= limit:
+                continue
+            conversation[i] = {**message, "content": content[:limit] + f"...[已截断 {len(content) - limit} 个字符]"}
+            new_tokens = message_tokens(conversation[i])
+            total -= tokens[i] - new_tokens
+            tokens[i] = new_tokens
+            self.truncated += 1
+        return total
+
+    def _elide_tool_results(self, conversation: List[Dict], tokens: List[int], total: int) -> int:
+        for i in range(1, self._protected_from(conversation)):
+            if total <= self.max_tokens:
+                break
+            message = conversation[i]
+            if message["role"] != "tool" or message.get("content") == ELIDED_TOOL_RESULT:
+                continue
+            conversation[i] = {**message, "content": ELIDED_TOOL_RESULT}
+            new_tokens = message_tokens(conversation[i])
+            total -= tokens[i] - new_tokens
+            tokens[i] = new_tokens
+            self.elided += 1
+        return total
+
+    def _drop_tool_batches(self, conversation: List[Dict], tokens: List[int], total: int) -> int:
+        protected = self._protected_from(conversation)
+        if protected < len(conversation):
+            # 最新一批工具调用的 assistant 消息和它的结果一起保留
+            protected -= 1
+        start = max((i for i, message in enumerate(conversation) if i > 0 and message["role"] == "user"), default=0)
+        # 当前这一轮里较早的工具调用批次：assistant(tool_calls) 加上紧跟着的 tool 消息
+        batches = []
+        i = start + 1
+        while i < protected:
+            if conversation[i]["role"] == "assistant" and conversation[i].get("tool_calls"):
+                end = i + 1
+                while end < protected and conversation[end]["role"] == "tool":
+                    end += 1
+                batches.append((i, end))
+                i = end
+            else:
+                i += 1
+        dropped = []
+        for begin, end in batches:
+            if total <= self.max_tokens:
+                break
+            total -= sum(tokens[begin:end])
+            dropped.append((begin, end))
+        # 从后往前删除，前面的下标不受影响
+        for begin, end in reversed(dropped):
+            del conversation[begin:end]
+            del tokens[begin:end]
+            self.dropped += end - begin
+        return total
+
+    async def _drop_old_turns(self, conversation: List[Dict], tokens: List[int], total: int) -> int:
+        user_indexes = [i for i, message in enumerate(conversation) if i > 0 and message["role"] == "user"]
+        if not user_indexes:
+            return total
+        # 按轮次丢弃：从 system 之后开始，到下一条 user 消息之前为一轮，工具调用和结果一起丢弃
+        end = 1
+        for following in user_indexes[1:]:
+            if total <= self.max_tokens:
+                break
+            total -= sum(tokens[end:following])
+            end = following
+        if end == 1:
+            return total
+
+        dropped = conversation[1:end]
+        replacement = []
+        if self.summarizer is not None:
+            try:
+                summary = await self.summarizer(dropped)
+                # 摘要作为 system 消息插入，模型不会把它当成用户说的话
+                replacement = [{"role": "system", "content": f"之前对话的摘要: {summary}"}]
+                total += message_tokens(replacement[0])
+            except Exception as e:
+                logger.warning(f"Failed to summarize the dropped turns: {e}")
+        conversation[1:end] = replacement
+        tokens[1:end] = [message_tokens(message) for message in replacement]
+        self.dropped += len(dropped)
+        return total
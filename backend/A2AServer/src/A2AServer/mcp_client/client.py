@@ -7,12 +7,14 @@ import sys
 import json
 import asyncio
 import logging
-from typing import Any, Dict, List, Optional, Union, AsyncGenerator
+from typing import Any, Dict, List, Optional, Tuple, Union, AsyncGenerator
 
 from mcp.client.sse import sse_client
 from mcp import ClientSession
 
+from A2AServer.common.utils.hot_log import HotPathLogger
 from .utils import load_mcp_config_from_file
+from .tool_cache import ToolResultCache
 from .providers.openai import generate_with_openai
 from .providers.deepseek import generate_with_deepseek
 from .providers.anthropic import generate_with_anthropic
@@ -23,6 +25,7 @@ from .providers.bytedance import generate_with_bytedance
 from .providers.zhipu import generate_with_zhipu
 
 logger = logging.getLogger(__name__)
+hot_log = HotPathLogger(logger)
 
 
 class SSEMCPClient:
@@ -75,7 +78,7 @@ class SSEMCPClient:
         if not self.session:
             return {"error": "MCP Not connected"}
         try:
-            logger.info(f"开始使用MCP协议调用工具，tool_name: {tool_name}, arguments: {arguments}")
+            hot_log.debug("tool_call", "开始使用MCP协议调用工具，tool_name: %s, arguments: %s", tool_name, arguments)
             response = await self.session.call_tool(tool_name, arguments)
             # 将 pydantic 模型转换为字典格式
             return response.model_dump() if hasattr(response, 'model_dump') else response
@@ -106,6 +109,10 @@ class MCPClient:
         self.server_capabilities = {}
         self._shutdown = False
         self._cleanup_lock = asyncio.Lock()
+        # 调用方已经放弃等待的请求 id，之后到达的响应直接丢弃
+        self._abandoned_requests = set()
+        # 后台发送消息的任务，保留引用避免在执行前被垃圾回收
+        self._background_tasks = set()
 
     async def _receive_loop(self):
         if not self.process or self.process.stdout.at_eof():
@@ -126,6 +133,9 @@ class MCPClient:
     def _process_message(self, message: dict):
         if "jsonrpc" in message and "id" in message:
             if "result" in message or "error" in message:
+                if message["id"] in self._abandoned_requests:
+                    self._abandoned_requests.discard(message["id"])
+                    return
                 self.responses[message["id"]] = message
             else:
                 # request from server, not implemented
@@ -137,7 +147,7 @@ class MCPClient:
                         "message": f"Method {message.get('method')} not implemented in client"
                     }
                 }
-                asyncio.create_task(self._send_message(resp))
+                self._send_in_background(resp)
         elif "jsonrpc" in message and "method" in message and "id" not in message:
             # notification from server
             pass
@@ -276,11 +286,38 @@ class MCPClient:
 
         except asyncio.TimeoutError:
             logger.error(f"错误: Server {self.server_name}: Tool {tool_name} timed out after {timeout}s")
+            self._abandon_request(rid, "timeout")
             return {"error": f"Timeout waiting for tool result after {timeout}s"}
+        except asyncio.CancelledError:
+            logger.info(f"Server {self.server_name}: Tool {tool_name} call {rid} was cancelled")
+            self._abandon_request(rid, "cancelled")
+            raise
         except Exception as e:
             logger.error(f"错误: Server {self.server_name}: An unexpected error occurred: {e}")
             return {"error": f"An unexpected error occurred: {e}"}
 
+    def _abandon_request(self, rid: int, reason: str):
+        """Stop waiting for a request and tell the server to cancel it."""
+        if self.responses.pop(rid, None) is None:
+            self._abandoned_requests.add(rid)
+        note = {
+            "jsonrpc": "2.0",
+            "method": "notifications/cancelled",
+            "params": {"requestId": rid, "reason": reason},
+        }
+        self._send_in_background(note)
+
+    def _send_in_background(self, message: dict):
+        """Send ``message`` without waiting, keeping the task until it finishes."""
+        task = asyncio.create_task(self._send_message(message))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+
+    def _background_task_done(self, task: asyncio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Server {self.server_name}: Background send failed: {task.exception()}")
+
     async def _send_message(self, message: dict):
         if not self.process or self._shutdown:
             logger.error(f"Server {self.server_name}: Cannot send message - process not running or shutting down")
@@ -367,6 +404,8 @@ async def generate_text(conversation: List[Dict], model_cfg: Dict,
     Returns:
         If stream=False: Dict containing assistant_text and tool_calls
         If stream=True: AsyncGenerator yielding chunks of assistant text and tool calls
+        A failed request yields/returns the error message as ``assistant_text``
+        with ``"error": True``.
     """
     provider = model_cfg.get("provider", "").lower()
 
@@ -414,7 +453,7 @@ async def generate_text(conversation: List[Dict], model_cfg: Dict,
                  elif provider == "lmstudio":
                      result = await generate_with_lmstudio(conversation, model_cfg, all_functions)
                  else: # Should not happen based on outer check, but good practice
-                     result = {"assistant_text": f"Unsupported provider '{provider}'", "tool_calls": []}
+                     result = {"assistant_text": f"Unsupported provider '{provider}'", "tool_calls": [], "error": True}
                  # Yield the complete result as a single item in the stream
                  yield result
              # *** Return the RESULT OF CALLING wrap_response() ***
@@ -422,7 +461,7 @@ async def generate_text(conversation: List[Dict], model_cfg: Dict,
         else:
              # Fallback for unsupported streaming providers
              async def empty_gen():
-                 yield {"assistant_text": f"Unsupported streaming provider '{provider}'", "tool_calls": []}
+                 yield {"assistant_text": f"Unsupported streaming provider '{provider}'", "tool_calls": [], "error": True}
                  # The 'if False:' trick ensures this is treated as an async generator
                  if False: yield
              return empty_gen()
@@ -446,7 +485,7 @@ async def generate_text(conversation: List[Dict], model_cfg: Dict,
         elif provider == "lmstudio":
             return await generate_with_lmstudio(conversation, model_cfg, all_functions)
         else:
-            return {"assistant_text": f"Unsupported provider '{provider}'", "tool_calls": []}
+            return {"assistant_text": f"Unsupported provider '{provider}'", "tool_calls": [], "error": True}
 
 async def log_messages_to_file(messages: List[Dict], functions: List[Dict], log_path: str):
     """
@@ -474,6 +513,19 @@ async def log_messages_to_file(messages: List[Dict], functions: List[Dict], log_
 
 async def process_tool_call(tc: Dict, servers: Dict[str, MCPClient], quiet_mode: bool) -> Optional[Dict]:
     """Process a single tool call and return the result"""
+    message, _ = await run_tool_call(tc, servers, quiet_mode)
+    return message
+
+async def run_tool_call(
+    tc: Dict, servers: Dict[str, MCPClient], quiet_mode: bool, cache: Optional[ToolResultCache] = None
+) -> Tuple[Dict, Any]:
+    """Process a single tool call.
+
+    Returns the tool message for the conversation together with the tool
+    result as a Python object, so callers don't have to parse the message
+    content again. Results of tools that opted in to ``cache`` are served
+    from it without an MCP round trip.
+    """
     func_name = tc["function"]["name"]
     func_args_str = tc["function"].get("arguments", "{}")
     try:
@@ -481,26 +533,24 @@ async def process_tool_call(tc: Dict, servers: Dict[str, MCPClient], quiet_mode:
     except:
         func_args = {}
 
-    parts = func_name.split("_", 1)
-    if len(parts) != 2:
+    def tool_message(result):
         return {
             "role": "tool",
             "tool_call_id": tc["id"],
             "name": func_name,
-            "content": json.dumps({"error": "Invalid function name format"})
-        }
+            "content": json.dumps(result)
+        }, result
+
+    parts = func_name.split("_", 1)
+    if len(parts) != 2:
+        return tool_message({"error": "Invalid function name format"})
 
     srv_name, tool_name = parts
-    print(f"\n调用process_tool_call开始获取运行MCP工具{tool_name} from {srv_name} {json.dumps(func_args, ensure_ascii=False)}")
+    hot_log.info("tool_call", "调用process_tool_call开始获取运行MCP工具%s from %s %s", tool_name, srv_name, func_args)
 
     if srv_name not in servers:
-        print(f"错误：注意，模型生成的服务器{srv_name}不在服务器列表中，请检查配置文件，或者查看你的mcp配置是否包含了特殊字符_")
-        return {
-            "role": "tool",
-            "tool_call_id": tc["id"],
-            "name": func_name,
-            "content": json.dumps({"error": f"Unknown server: {srv_name}"})
-        }
+        logger.error(f"错误：注意，模型生成的服务器{srv_name}不在服务器列表中，请检查配置文件，或者查看你的mcp配置是否包含了特殊字符_")
+        return tool_message({"error": f"Unknown server: {srv_name}"})
 
     # Get the tool's schema
     tool_schema = None
@@ -514,23 +564,20 @@ async def process_tool_call(tc: Dict, servers: Dict[str, MCPClient], quiet_mode:
         required_params = tool_schema.get("required", [])
         for param in required_params:
             if param not in func_args:
-                return {
-                    "role": "tool",
-                    "tool_call_id": tc["id"],
-                    "name": func_name,
-                    "content": json.dumps({"error": f"Missing required parameter: {param}"})
-                }
-    print(f"开始调用call_tool")
+                return tool_message({"error": f"Missing required parameter: {param}"})
+    use_cache = cache is not None and cache.cacheable(srv_name, tool_name)
+    if use_cache:
+        hit, result = cache.get(srv_name, tool_name, func_args)
+        if hit:
+            hot_log.debug("tool_cache", "工具%s命中缓存: %s", tool_name, func_args)
+            return tool_message(result)
     result = await servers[srv_name].call_tool(tool_name, func_args)
-    print(f"工具{tool_name}运行结果:")
-    print(json.dumps(result, indent=2, ensure_ascii=False))
-
-    return {
-        "role": "tool",
-        "tool_call_id": tc["id"],
-        "name": func_name,
-        "content": json.dumps(result)
-    }
+    hot_log.debug("tool_result", "工具%s运行结果: %s", tool_name, result)
+    if use_cache:
+        # 出错的结果不会写入缓存
+        cache.put(srv_name, tool_name, func_args, result)
+
+    return tool_message(result)
 
 async def run_interaction(
     user_query: str,
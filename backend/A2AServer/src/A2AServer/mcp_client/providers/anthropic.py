@@ -368,7 +368,7 @@ async def generate_with_anthropic(conversation, model_cfg, all_functions):
                             }
                         }
                         tool_calls.append(tool_call)
-                        print(f"{assistant_text}")
+                        logger.debug("%s", assistant_text)
             
             # Store the result to return after client is closed
             result = {"assistant_text": assistant_text, "tool_calls": tool_calls}
@@ -376,13 +376,13 @@ async def generate_with_anthropic(conversation, model_cfg, all_functions):
         except AnthropicAPIError as e:
             error_msg = str(e)
             logger.error(f"Anthropic API error: {error_msg}")
-            result = {"assistant_text": f"Anthropic error: {error_msg}", "tool_calls": []}
+            result = {"assistant_text": f"Anthropic error: {error_msg}", "tool_calls": [], "error": True}
             
         except Exception as e:
             import traceback
             logger.error(f"Unexpected error in Anthropic provider: {str(e)}")
             logger.error(traceback.format_exc())
-            result = {"assistant_text": f"Unexpected Anthropic error: {str(e)}", "tool_calls": []}
+            result = {"assistant_text": f"Unexpected Anthropic error: {str(e)}", "tool_calls": [], "error": True}
     
     finally:
         # Always clean up the client
@@ -7,11 +7,13 @@ import json
 from typing import Dict, List, Any, AsyncGenerator, Optional, Union
 
 from openai import AsyncOpenAI, APIError, RateLimitError
+from ..utils import ready_tool_calls
 
 async def generate_with_bytedance_stream(client: AsyncOpenAI, model_name: str, conversation: List[Dict],
                                     formatted_functions: List[Dict], temperature: Optional[float] = None,
                                     top_p: Optional[float] = None, max_tokens: Optional[int] = None) -> AsyncGenerator:
     """Internal function for streaming generation"""
+    response = None
     try:
         response = await client.chat.completions.create(
             model=model_name,
@@ -25,6 +27,7 @@ async def generate_with_bytedance_stream(client: AsyncOpenAI, model_name: str, c
         )
 
         current_tool_calls = []
+        ready_ids = set()
         current_content = ""
 
         async for chunk in response:
@@ -77,6 +80,10 @@ async def generate_with_bytedance_stream(client: AsyncOpenAI, model_name: str, c
                             # Middle part of JSON - append carefully
                             current_tool["function"]["arguments"] += new_args
 
+            # 参数已经完整的工具调用先交给调用方提前执行，不用等整个回复结束
+            for tc in ready_tool_calls(current_tool_calls, ready_ids):
+                yield {"assistant_text": "", "tool_calls": [tc], "is_chunk": True, "tool_call_ready": True}
+
             # If this is the last chunk, yield final state with complete tool calls
             if chunk.choices[0].finish_reason is not None:
                 # Clean up and validate tool calls
@@ -119,7 +126,11 @@ async def generate_with_bytedance_stream(client: AsyncOpenAI, model_name: str, c
                 }
 
     except Exception as e:
-        yield {"assistant_text": f"bytedance API error: {str(e)}", "tool_calls": [], "is_chunk": False}
+        yield {"assistant_text": f"bytedance API error: {str(e)}", "tool_calls": [], "is_chunk": False, "error": True}
+    finally:
+        # 任务被取消或者调用方提前关闭生成器时，立即断开和模型服务的流式连接
+        if response is not None:
+            await response.close()
 
 async def generate_with_bytedance_sync(client: AsyncOpenAI, model_name: str, conversation: List[Dict],
                                   formatted_functions: List[Dict], temperature: Optional[float] = None,
@@ -160,11 +171,11 @@ async def generate_with_bytedance_sync(client: AsyncOpenAI, model_name: str, con
         return {"assistant_text": assistant_text, "tool_calls": tool_calls}
 
     except APIError as e:
-        return {"assistant_text": f"Bytedance API error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Bytedance API error: {str(e)}", "tool_calls": [], "error": True}
     except RateLimitError as e:
-        return {"assistant_text": f"Bytedance rate limit: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Bytedance rate limit: {str(e)}", "tool_calls": [], "error": True}
     except Exception as e:
-        return {"assistant_text": f"Unexpected Bytedance error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Unexpected Bytedance error: {str(e)}", "tool_calls": [], "error": True}
 
 async def generate_with_bytedance(conversation: List[Dict], model_cfg: Dict,
                              all_functions: List[Dict], stream: bool = False) -> Union[Dict, AsyncGenerator]:
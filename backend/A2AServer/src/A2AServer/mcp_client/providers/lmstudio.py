@@ -89,7 +89,7 @@ async def generate_with_lmstudio(conversation: List[Dict], model_cfg: Dict,
         
     except Exception as e:
         logger.error(f"LMStudio error: {str(e)}")
-        return {"assistant_text": f"LMStudio error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"LMStudio error: {str(e)}", "tool_calls": [], "error": True}
 
 def _convert_functions_to_callables(all_functions: List[Dict]) -> List:
     """
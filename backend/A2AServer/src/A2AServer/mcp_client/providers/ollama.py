@@ -371,7 +371,7 @@ async def generate_with_ollama(
         chat, Client, ResponseError = ollama_imports
     except Exception as e:
         logger.error(f"Unexpected error during Ollama import: {e}")
-        return {"assistant_text": f"Unexpected Ollama import error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Unexpected Ollama import error: {str(e)}", "tool_calls": [], "error": True}
 
     # Get model name from config
     model_name = model_cfg.get("model", "")
@@ -432,7 +432,7 @@ async def generate_with_ollama(
     except Exception as e:
         logger.error(f"Unexpected error in generate_with_ollama: {e}")
         traceback.print_exc()
-        return {"assistant_text": f"Unexpected error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Unexpected error: {str(e)}", "tool_calls": [], "error": True}
 
 
 def import_ollama_components() -> Optional[tuple]:
@@ -514,12 +514,13 @@ async def call_ollama_api(
         logger.error(f"Pydantic validation error: {e}")
         return {
             "assistant_text": f"Ollama SDK Validation Error: {str(e)}",
-            "tool_calls": []
+            "tool_calls": [],
+            "error": True
         }
     except ResponseError as e:
         logger.error(f"Ollama API ResponseError: {e}")
-        return {"assistant_text": f"Ollama error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Ollama error: {str(e)}", "tool_calls": [], "error": True}
     except Exception as e:
         logger.error(f"Unexpected error during Ollama API call: {e}")
         traceback.print_exc()
-        return {"assistant_text": f"Unexpected Ollama error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Unexpected Ollama error: {str(e)}", "tool_calls": [], "error": True}
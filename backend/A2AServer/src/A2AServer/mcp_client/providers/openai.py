@@ -7,11 +7,13 @@ import json
 from typing import Dict, List, Any, AsyncGenerator, Optional, Union
 
 from openai import AsyncOpenAI, APIError, RateLimitError
+from ..utils import ready_tool_calls, usage_to_dict
 
 async def generate_with_openai_stream(client: AsyncOpenAI, model_name: str, conversation: List[Dict],
                                     formatted_functions: List[Dict], temperature: Optional[float] = None,
                                     top_p: Optional[float] = None, max_tokens: Optional[int] = None) -> AsyncGenerator:
     """Internal function for streaming generation"""
+    response = None
     try:
         response = await client.chat.completions.create(
             model=model_name,
@@ -21,13 +23,21 @@ async def generate_with_openai_stream(client: AsyncOpenAI, model_name: str, conv
             max_tokens=max_tokens,
             tools=[{"type": "function", "function": f} for f in formatted_functions],
             tool_choice="auto",
-            stream=True
+            stream=True,
+            # 最后一个分块返回 token 用量，用来统计前缀缓存命中的 token 数
+            stream_options={"include_usage": True},
         )
 
         current_tool_calls = []
+        ready_ids = set()
         current_content = ""
 
         async for chunk in response:
+            if chunk.usage is not None:
+                yield {"assistant_text": "", "tool_calls": [], "is_chunk": True, "usage": usage_to_dict(chunk.usage)}
+            if not chunk.choices:
+                # 只带用量的分块没有 choices
+                continue
             delta = chunk.choices[0].delta
             
             if delta.content:
@@ -75,6 +85,10 @@ async def generate_with_openai_stream(client: AsyncOpenAI, model_name: str, conv
                             # Middle part of JSON - append carefully
                             current_tool["function"]["arguments"] += new_args
 
+            # 参数已经完整的工具调用先交给调用方提前执行，不用等整个回复结束
+            for tc in ready_tool_calls(current_tool_calls, ready_ids):
+                yield {"assistant_text": "", "tool_calls": [tc], "is_chunk": True, "tool_call_ready": True}
+
             # If this is the last chunk, yield final state with complete tool calls
             if chunk.choices[0].finish_reason is not None:
                 # Clean up and validate tool calls
@@ -117,7 +131,11 @@ async def generate_with_openai_stream(client: AsyncOpenAI, model_name: str, conv
                 }
 
     except Exception as e:
-        yield {"assistant_text": f"OpenAI error: {str(e)}", "tool_calls": [], "is_chunk": False}
+        yield {"assistant_text": f"OpenAI error: {str(e)}", "tool_calls": [], "is_chunk": False, "error": True}
+    finally:
+        # 任务被取消或者调用方提前关闭生成器时，立即断开和模型服务的流式连接
+        if response is not None:
+            await response.close()
 
 async def generate_with_openai_sync(client: AsyncOpenAI, model_name: str, conversation: List[Dict], 
                                   formatted_functions: List[Dict], temperature: Optional[float] = None,
@@ -155,14 +173,14 @@ async def generate_with_openai_sync(client: AsyncOpenAI, model_name: str, conver
                     except json.JSONDecodeError:
                         tool_call["function"]["arguments"] = "{}"
                     tool_calls.append(tool_call)
-        return {"assistant_text": assistant_text, "tool_calls": tool_calls}
+        return {"assistant_text": assistant_text, "tool_calls": tool_calls, "usage": usage_to_dict(response.usage)}
 
     except APIError as e:
-        return {"assistant_text": f"OpenAI API error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"OpenAI API error: {str(e)}", "tool_calls": [], "error": True}
     except RateLimitError as e:
-        return {"assistant_text": f"OpenAI rate limit: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"OpenAI rate limit: {str(e)}", "tool_calls": [], "error": True}
     except Exception as e:
-        return {"assistant_text": f"Unexpected OpenAI error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Unexpected OpenAI error: {str(e)}", "tool_calls": [], "error": True}
 
 async def generate_with_openai(conversation: List[Dict], model_cfg: Dict, 
                              all_functions: List[Dict], stream: bool = False) -> Union[Dict, AsyncGenerator]:
@@ -7,11 +7,13 @@ import json
 from typing import Dict, List, Any, AsyncGenerator, Optional, Union
 
 from openai import AsyncOpenAI, APIError, RateLimitError
+from ..utils import ready_tool_calls
 
 async def generate_with_zhipu_stream(client: AsyncOpenAI, model_name: str, conversation: List[Dict],
                                     formatted_functions: List[Dict], temperature: Optional[float] = None,
                                     top_p: Optional[float] = None, max_tokens: Optional[int] = None) -> AsyncGenerator:
     """Internal function for streaming generation"""
+    response = None
     try:
         response = await client.chat.completions.create(
             model=model_name,
@@ -25,6 +27,7 @@ async def generate_with_zhipu_stream(client: AsyncOpenAI, model_name: str, conve
         )
 
         current_tool_calls = []
+        ready_ids = set()
         current_content = ""
 
         async for chunk in response:
@@ -75,6 +78,10 @@ async def generate_with_zhipu_stream(client: AsyncOpenAI, model_name: str, conve
                             # Middle part of JSON - append carefully
                             current_tool["function"]["arguments"] += new_args
 
+            # 参数已经完整的工具调用先交给调用方提前执行，不用等整个回复结束
+            for tc in ready_tool_calls(current_tool_calls, ready_ids):
+                yield {"assistant_text": "", "tool_calls": [tc], "is_chunk": True, "tool_call_ready": True}
+
             # If this is the last chunk, yield final state with complete tool calls
             if chunk.choices[0].finish_reason is not None:
                 # Clean up and validate tool calls
@@ -117,7 +124,11 @@ async def generate_with_zhipu_stream(client: AsyncOpenAI, model_name: str, conve
                 }
 
     except Exception as e:
-        yield {"assistant_text": f"Zhipu API error: {str(e)}", "tool_calls": [], "is_chunk": False}
+        yield {"assistant_text": f"Zhipu API error: {str(e)}", "tool_calls": [], "is_chunk": False, "error": True}
+    finally:
+        # 任务被取消或者调用方提前关闭生成器时，立即断开和模型服务的流式连接
+        if response is not None:
+            await response.close()
 
 async def generate_with_zhipu_sync(client: AsyncOpenAI, model_name: str, conversation: List[Dict],
                                   formatted_functions: List[Dict], temperature: Optional[float] = None,
@@ -158,11 +169,11 @@ async def generate_with_zhipu_sync(client: AsyncOpenAI, model_name: str, convers
         return {"assistant_text": assistant_text, "tool_calls": tool_calls}
 
     except APIError as e:
-        return {"assistant_text": f"Zhipu API error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Zhipu API error: {str(e)}", "tool_calls": [], "error": True}
     except RateLimitError as e:
-        return {"assistant_text": f"Zhipu rate limit: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Zhipu rate limit: {str(e)}", "tool_calls": [], "error": True}
     except Exception as e:
-        return {"assistant_text": f"Unexpected Zhipu error: {str(e)}", "tool_calls": []}
+        return {"assistant_text": f"Unexpected Zhipu error: {str(e)}", "tool_calls": [], "error": True}
 
 async def generate_with_zhipu(conversation: List[Dict], model_cfg: Dict,
                              all_functions: List[Dict], stream: bool = False) -> Union[Dict, AsyncGenerator]:
@@ -0,0 +1,89 @@
+"""Memoizing cache for results of idempotent MCP tools."""
+
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+
+def is_error_result(result: Any) -> bool:
+    """Errors from the client ({"error": ...}) and MCP results with isError set."""
+    return isinstance(result, dict) and ("error" in result or bool(result.get("isError")))
+
+
+class ToolResultCache:
+    """LRU cache of tool results with a TTL per tool.
+
+    Only tools that opt in are cached. In ``mcp_config.json`` a server lists
+    its cacheable tools with their TTL in seconds::
+
+        "LNGPrice": {"command": "...", "cacheTools": {"get_lng_price": 300}}
+
+    and the top-level ``"toolCache": {"maxEntries": 1024}`` bounds the
+    number of cached results. Error results are never stored.
+    """
+
+    def __init__(self, tool_ttls: Dict[Tuple[str, str], float] | None = None, max_entries: int = 1024):
+        self.tool_ttls = tool_ttls or {}
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (过期时间, 结果)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ToolResultCache":
+        tool_ttls = {}
+        for server_name, conf in config.get("mcpServers", {}).items():
+            for tool_name, ttl in conf.get("cacheTools", {}).items():
+                tool_ttls[(server_name, tool_name)] = float(ttl)
+        cache_cfg = config.get("toolCache", {})
+        return cls(tool_ttls, max_entries=cache_cfg.get("maxEntries", 1024))
+
+    @staticmethod
+    def make_key(server_name: str, tool_name: str, arguments: Dict) -> str:
+        # 参数按 key 排序后序列化，参数顺序不同的相同调用命中同一个缓存
+        args = json.dumps(arguments, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return f"{server_name}\x00{tool_name}\x00{args}"
+
+    def cacheable(self, server_name: str, tool_name: str) -> bool:
+        return (server_name, tool_name) in self.tool_ttls
+
+    def get(self, server_name: str, tool_name: str, arguments: Dict) -> Tuple[bool, Any]:
+        """Return (hit, result) for a cacheable tool call."""
+        key = self.make_key(server_name, tool_name, arguments)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, result
+            del self._entries[key]
+        self.misses += 1
+        return False, None
+
+    def put(self, server_name: str, tool_name: str, arguments: Dict, result: Any):
+        ttl = self.tool_ttls.get((server_name, tool_name))
+        if ttl is None or ttl <= 0 or is_error_result(result):
+            return
+        key = self.make_key(server_name, tool_name, arguments)
+        self._entries[key] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
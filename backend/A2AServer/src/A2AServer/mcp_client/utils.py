@@ -88,3 +88,49 @@ def parse_arguments():
 
     user_query = " ".join(user_query_parts)
     return chosen_model, user_query, quiet_mode, config_path, log_messages_path
+
+
+def ready_tool_calls(current_tool_calls: list, ready_ids: set) -> list:
+    """
+    Return the streamed tool calls whose arguments have just become complete.
+
+    A call is ready once it has an id and a name and its accumulated
+    arguments parse as a JSON object; a JSON object is only valid once its
+    closing brace has arrived. Ids of returned calls are added to
+    ``ready_ids`` so each call is reported once. The returned copies carry
+    the arguments re-serialized the same way as the final tool calls.
+    """
+    ready = []
+    for tc in current_tool_calls:
+        if not tc["id"] or not tc["function"]["name"] or tc["id"] in ready_ids:
+            continue
+        if not tc["function"]["arguments"].rstrip().endswith("}"):
+            continue
+        try:
+            args = json.loads(tc["function"]["arguments"])
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(args, dict):
+            continue
+        ready_ids.add(tc["id"])
+        ready.append({"id": tc["id"], "function": {"name": tc["function"]["name"], "arguments": json.dumps(args)}})
+    return ready
+
+
+def usage_to_dict(usage) -> Optional[dict]:
+    """
+    Token usage reported by an OpenAI-compatible API, including how many
+    prompt tokens were served from the provider's prefix cache.
+    """
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        # DeepSeek 用 prompt_cache_hit_tokens 返回命中缓存的 token 数
+        cached = (getattr(usage, "model_extra", None) or {}).get("prompt_cache_hit_tokens")
+    return {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+        "cached_tokens": cached or 0,
+    }
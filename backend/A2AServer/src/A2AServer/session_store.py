@@ -0,0 +1,114 @@
+"""Per-session conversation state for BasicAgent."""
+
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+
+class Session:
+    """The conversation history of one sessionId.
+
+    ``messages`` holds the user, assistant and tool messages of finished
+    turns (the system prompt is rebuilt for every turn). ``lock`` serializes
+    turns of the same session; different sessions run concurrently.
+    ``pins`` counts the turns that hold or wait for the lock; ``holder`` is
+    the asyncio task holding it.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.messages: List[Dict] = []
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.pins = 0
+        self.holder: asyncio.Task | None = None
+
+    @property
+    def in_use(self) -> bool:
+        return self.pins > 0 or self.lock.locked()
+
+
+class SessionStore:
+    """LRU/TTL-bounded map of sessionId -> Session.
+
+    ``max_sessions`` caps the number of sessions kept; the least recently
+    used idle session is dropped first. ``ttl`` drops sessions idle for
+    longer than that many seconds. Sessions with a turn in progress or
+    waiting are never dropped. None disables the corresponding bound.
+    """
+
+    def __init__(self, max_sessions: int | None = 1000, ttl: float | None = 3600):
+        if max_sessions is not None and max_sessions <= 0:
+            raise ValueError("max_sessions must be positive")
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.evictions = 0
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Session:
+        """Return the session for ``session_id``, creating it if needed."""
+        now = time.monotonic()
+        session = self._sessions.get(session_id)
+        if session is not None and self._expired(session, now):
+            del self._sessions[session_id]
+            self.evictions += 1
+            session = None
+        if session is None:
+            session = self._sessions[session_id] = Session(session_id)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_used = now
+        self._enforce_limits(now, keep=session_id)
+        return session
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, session_id: str):
+        """Hold the session of ``session_id`` for one turn, with its lock taken.
+
+        Re-entering from the asyncio task that already holds the session
+        does not wait, e.g. when AgentPool takes the session before leasing
+        the context that runs the turn.
+        """
+        # get 和加锁之间会等待，先把 session 固定住，等待期间不会被淘汰后又新建一个同 id 的 session
+        session = self.get(session_id)
+        task = asyncio.current_task()
+        if session.holder is not None and session.holder is task:
+            yield session
+            return
+        session.pins += 1
+        try:
+            async with session.lock:
+                session.holder = task
+                try:
+                    yield session
+                finally:
+                    session.holder = None
+        finally:
+            session.pins -= 1
+            session.last_used = time.monotonic()
+
+    def sessions(self) -> List[Session]:
+        return list(self._sessions.values())
+
+    def _expired(self, session: Session, now: float) -> bool:
+        return (
+            self.ttl is not None
+            and not session.in_use
+            and now - session.last_used > self.ttl
+        )
+
+    def _enforce_limits(self, now: float, keep: str | None = None):
+        # OrderedDict 按最近使用的顺序排列，从最久未使用的一端开始清理
+        for session_id, session in list(self._sessions.items()):
+            over_limit = self.max_sessions is not None and len(self._sessions) > self.max_sessions
+            if not over_limit and not self._expired(session, now):
+                break
+            if session_id == keep or session.in_use:
+                continue
+            del self._sessions[session_id]
+            self.evictions += 1
@@ -21,43 +21,55 @@ from A2AServer.common.A2Atypes import (
     TaskStatusUpdateEvent
 )
 from A2AServer.common.server.task_manager import InMemoryTaskManager
+from A2AServer.common.server.task_store import TaskStore
 from A2AServer.agent import BasicAgent
+from A2AServer.agent_pool import AgentPool
 import A2AServer.common.server.utils as utils
+from A2AServer.common.server.utils import ArtifactAssembler
+from A2AServer.common.utils.hot_log import HotPathLogger
 import asyncio
+import contextlib
 import logging
 import traceback
 
 logger = logging.getLogger(__name__)
+# 每个 token / 事件都会走到的日志，默认 DEBUG 级别，可以按事件类型采样
+hot_log = HotPathLogger(logger)
 
 
-def decode_tool_calls_to_string(raw_str: str) -> str:
-    # 解析 JSON
-    tool_calls = json.loads(raw_str)
+TOOL_OUTPUT_MODES = ("text", "data")
 
-    # 解码每个 tool_call 的 arguments
+
+def decode_tool_calls(tool_calls: list | str) -> list:
+    """Copy the tool calls with their ``arguments`` decoded from JSON where possible."""
+    if isinstance(tool_calls, str):
+        tool_calls = json.loads(tool_calls)
+    decoded = []
     for call in tool_calls:
-        args_str = call.get("function", {}).get("arguments", "")
+        function = call.get("function", {})
+        args = function.get("arguments", "")
         try:
-            call["function"]["arguments"] = json.loads(args_str)
-        except json.JSONDecodeError:
-            pass  # 如果解析失败就跳过
-
-    # 返回格式化的 JSON 字符串（ensure_ascii=False 让中文显示正常）
-    return json.dumps(tool_calls, ensure_ascii=False, indent=2)
+            args = json.loads(args)
+        except (TypeError, json.JSONDecodeError):
+            pass  # 如果解析失败就保留原样
+        decoded.append({**call, "function": {**function, "arguments": args}})
+    return decoded
 
 
-def decode_tool_call_result_to_string(raw_str: str) -> str:
-    load_json = json.loads(raw_str)
+def decode_tool_call_result(tool_result: dict | str) -> dict:
+    """Copy the tool result with the text of the tool output decoded from JSON where possible."""
+    if isinstance(tool_result, str):
+        tool_result = json.loads(tool_result)
     # tool执行的结果
-    content = load_json.get("content", "")
-    if content:
-        content_data = json.loads(content)
-        logger.info(f"decode_tool_call_result_to_string: content_data: {content_data}")
+    content_data = tool_result.get("content", "")
+    if isinstance(content_data, str) and content_data:
+        content_data = json.loads(content_data)
+    if isinstance(content_data, dict):
+        content_data = dict(content_data)
         if "error" in content_data:
             logger.warning("Tool call error: %s", content_data["error"])
         else:
-            nest_contents = content_data["content"]
-            for content_item in nest_contents:
+            for content_item in content_data.get("content", []):
                 if "text" in content_item:
                     content_json_text = content_item["text"]
                     try:
@@ -67,18 +79,102 @@ def decode_tool_call_result_to_string(raw_str: str) -> str:
                         # 说明工具运行的结果不是数组，不需要处理了，直接使用
                         content_text = content_json_text
                     content_data["content"] = content_text
-    load_json["content"] = content_data
-    # 变成中文的返回
-    json_data = json.dumps(load_json, ensure_ascii=False, indent=2)
-    return json_data
+    return {**tool_result, "content": content_data}
+
+
+class TextDeltaCoalescer:
+    """Merge consecutive text deltas into fewer artifact events.
+
+    Buffered text is emitted once ``window_ms`` has passed since the first
+    buffered delta or ``max_chars`` characters are buffered, whichever comes
+    first. With both left at 0 every delta is emitted as it arrives.
+    """
+
+    def __init__(self, emit, window_ms: float = 0, max_chars: int = 0):
+        self._emit = emit
+        self.window = window_ms / 1000
+        self.max_chars = max_chars
+        self.deltas = 0
+        self.frames = 0
+        self._buffer: list[str] = []
+        self._chars = 0
+        self._timer = None
+        self._timer_flush = None
+
+    async def add(self, text: str):
+        self.deltas += 1
+        self._buffer.append(text)
+        self._chars += len(text)
+        if (self.window <= 0 and self.max_chars <= 0) or (
+            self.max_chars > 0 and self._chars >= self.max_chars
+        ):
+            await self.flush()
+        elif self.window > 0 and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._on_timer)
+
+    def _on_timer(self):
+        # 窗口到期时 agent 可能还在等下一个 token，这里主动把缓存的文本发出去
+        self._timer = None
+        self._timer_flush = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Emit the buffered text now, e.g. before a tool-call or status event."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer.clear()
+        self._chars = 0
+        self.frames += 1
+        await self._emit(text)
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._timer_flush is not None and not self._timer_flush.done():
+            self._timer_flush.cancel()
 
 
 class AgentTaskManager(InMemoryTaskManager):
     """Task manager for AG2 MCP agent."""
 
-    def __init__(self, agent: BasicAgent):
-        super().__init__()
+    def __init__(
+        self,
+        agent: BasicAgent | AgentPool,
+        task_store: TaskStore | None = None,
+        coalesce_ms: float = 0,
+        coalesce_chars: int = 0,
+        tool_output_mode: str = "text",
+    ):
+        """
+        agent: 单个 BasicAgent，或者 AgentPool，后者每个请求从池里借一个空闲的 agent 上下文
+        coalesce_ms / coalesce_chars: 流式输出时把连续的文本增量合并成一个 SSE 事件，
+            最多等待 coalesce_ms 毫秒或者攒够 coalesce_chars 个字符；都为 0 时每个增量单独发送
+        tool_output_mode: 工具调用和结果的输出方式，"text" 渲染成格式化的 JSON 文本，
+            "data" 作为 DataPart 原样发送
+        """
+        if tool_output_mode not in TOOL_OUTPUT_MODES:
+            raise ValueError(f"Unknown tool output mode: {tool_output_mode}")
+        super().__init__(task_store=task_store)
         self.agent = agent
+        self.tool_output_mode = tool_output_mode
+        self.coalesce_ms = coalesce_ms
+        self.coalesce_chars = coalesce_chars
+
+    async def warmup(self) -> None:
+        # 服务启动时就启动 MCP server 并加载工具，第一个请求不用等冷启动
+        await self.agent.warmup()
+
+    def is_ready(self) -> bool:
+        return self.agent.tool_ready
+
+    def _lease_agent(self, session_id: str):
+        if isinstance(self.agent, AgentPool):
+            return self.agent.lease(session_id)
+        return contextlib.nullcontext(self.agent)
 
     async def on_send_task(self, request: SendTaskRequest) -> SendTaskResponse:
         """
@@ -119,12 +215,27 @@ class AgentTaskManager(InMemoryTaskManager):
         This method initiates a streaming task and returns incremental updates
         to the client as they become available. It uses Server-Sent Events (SSE)
         to push updates to the client as the agent generates them.
+
+        The agent runs as a background job owned by the task manager, so it
+        keeps running if the client disconnects; clients can reattach with
+        tasks/resubscribe and read the result with tasks/get.
         """
         error = self._validate_request(request)
         if error:
             return error
+        # 在启动后台任务之前取出问题，不支持的消息直接返回错误，不会留下一个没人处理的任务
+        try:
+            query = self._get_user_query(request.params)
+        except ValueError as e:
+            logger.warning(f"Rejecting task {request.params.id}: {e}")
+            return utils.new_incompatible_types_error(request.id)
         await self.upsert_task(request.params)
-        return self._stream_generator(request)
+        self.reset_event_stream(request.params.id)
+        sse_event_queue = await self.setup_sse_consumer(request.params.id)
+        # agent 在后台运行，和这次 HTTP 连接解耦；连接断开后任务继续执行，结果写入任务存储
+        runner = asyncio.create_task(self._run_agent(request, query))
+        self.register_running_task(request.params.id, runner)
+        return self.dequeue_events_for_sse(request.id, request.params.id, sse_event_queue)
 
     # -------------------------------------------------------------
     # Agent response handlers
@@ -163,151 +274,186 @@ class AgentTaskManager(InMemoryTaskManager):
         task_result = self.append_task_history(updated_task, history_length)
         return SendTaskResponse(id=request.id, result=task_result)
 
-    async def _stream_generator(
-            self, request: SendTaskStreamingRequest
-    ) -> AsyncIterable[SendTaskStreamingResponse] | JSONRPCResponse:
+    async def _run_agent(self, request: SendTaskStreamingRequest, query: str):
         """
-        Handle the 'tasks/sendSubscribe' JSON-RPC method for streaming responses.
+        Run the agent for a 'tasks/sendSubscribe' request with the already extracted ``query``.
+
+        Every event is published through enqueue_events_for_sse; the caller's
+        SSE stream is one of the subscribers.
         """
         task_send_params: TaskSendParams = request.params
-        query = self._get_user_query(task_send_params)
         logger.info(f"发送过来的请求是 {query}, 参数是 {task_send_params}")
         is_first_token = True
-        artifacts = []
+        # 流式分块在这里按 index 合并，任务存储里只保留合并后的 artifact
+        assembler = ArtifactAssembler()
+
+        async def emit_text(text: str):
+            nonlocal is_first_token
+            artifact = Artifact(parts=[{"type": "text", "text": text}], index=0, append=not is_first_token, lastChunk=False)
+            is_first_token = False
+            assembler.add(artifact)
+            hot_log.debug("artifact", "发送的artifact是: %s", artifact)
+            await self._publish(
+                TaskArtifactUpdateEvent(
+                    id=task_send_params.id,
+                    artifact=artifact,
+                )
+            )
+
+        coalescer = TextDeltaCoalescer(emit_text, self.coalesce_ms, self.coalesce_chars)
+        item = {}
         try:
-            async for item in self.agent.stream(query, task_send_params.sessionId):
-                logger.info("返回的item: ", item)
-                if item.get("type") and item["type"] == "tool_call":
-                    content = decode_tool_calls_to_string(item["content"])
-                    logger.info(f"CALL的工具的解析结果: {content}")
-                    parts = [{"type": "text", "text": content+"\n"}]
-                    message = Message(role="agent", parts=parts)
-                    task_status = TaskStatus(state=TaskState.WORKING, message=message)
-                    task_update_event = TaskStatusUpdateEvent(
-                        id=task_send_params.id,
-                        status=task_status,
-                        final=False,
-                    )
-                    logger.info(f"发送的item的更新消息是: {task_update_event}")
-                    yield SendTaskStreamingResponse(id=request.id, result=task_update_event)
-                elif item.get("type") and item["type"] == "tool_result":
-                    content = decode_tool_call_result_to_string(item["content"])
-                    logger.info(f"RESULT的工具的解析结果: {content}")
-                    parts = [{"type": "text", "text": content+"\n"}]
-                    message = Message(role="agent", parts=parts)
-                    task_status = TaskStatus(state=TaskState.WORKING, message=message)
-                    task_update_event = TaskStatusUpdateEvent(
-                        id=task_send_params.id,
-                        status=task_status,
-                        final=False,
-                    )
-                    logger.info(f"发送的item的更新消息是: {task_update_event}")
-                    yield SendTaskStreamingResponse(id=request.id, result=task_update_event)
-                elif item.get("type") and item["type"] == "reasoning":
-                    content = item["content"]
-                    logger.info(f"推理的解析的结果: {content}")
-                    parts = [{"type": "text", "text": content}]
-                    message = Message(role="agent", parts=parts)
-                    task_status = TaskStatus(state=TaskState.WORKING, message=message)
-                    task_update_event = TaskStatusUpdateEvent(
-                        id=task_send_params.id,
-                        status=task_status,
-                        final=False,
-                    )
-                    logger.info(f"发送的item的更新消息是: {task_update_event}")
-                    yield SendTaskStreamingResponse(id=request.id, result=task_update_event)
-                elif item.get("type") and item["type"] == "normal":  # 正常的文本内容
-                    is_task_complete = item["is_task_complete"]
-                    if not is_task_complete:
-                        task_state = TaskState.WORKING
-                        if item.get("content"):
-                            parts = [{"type": "text", "text": item["content"]}]
-                            append_value = not is_first_token
-                            artifact = Artifact(parts=parts, index=0, append=append_value, lastChunk=False)
-                            # 逐条发送每个生成的内容
-                            logger.info(f"发送的artifact是: {artifact}")
-                            yield SendTaskStreamingResponse(
-                                id=request.id,
-                                result=TaskArtifactUpdateEvent(
+            await self.update_store(task_send_params.id, TaskStatus(state=TaskState.WORKING), None)
+            async with self._lease_agent(task_send_params.sessionId) as agent:
+                async for item in agent.stream(query, task_send_params.sessionId):
+                    hot_log.debug("item", "返回的item: %s", item)
+                    if item.get("type") != "normal" or item["is_task_complete"]:
+                        # 工具调用、状态和最终结果之前先把攒着的文本发出去，保证事件顺序
+                        await coalescer.flush()
+                    if item.get("type") and item["type"] == "tool_call":
+                        tool_calls = decode_tool_calls(item["content"])
+                        hot_log.debug("tool_call", "CALL的工具的解析结果: %s", tool_calls)
+                        parts = self._tool_parts("tool_call", {"tool_calls": tool_calls})
+                        message = Message(role="agent", parts=parts)
+                        task_status = TaskStatus(state=TaskState.WORKING, message=message)
+                        task_update_event = TaskStatusUpdateEvent(
+                            id=task_send_params.id,
+                            status=task_status,
+                            final=False,
+                        )
+                        hot_log.debug("status", "发送的item的更新消息是: %s", task_update_event)
+                        await self._publish(task_update_event)
+                    elif item.get("type") and item["type"] == "tool_result":
+                        if self.tool_output_mode == "data" and not isinstance(item["content"], str):
+                            tool_result = item["content"]
+                        else:
+                            tool_result = decode_tool_call_result(item["content"])
+                        hot_log.debug("tool_result", "RESULT的工具的解析结果: %s", tool_result)
+                        parts = self._tool_parts("tool_result", tool_result)
+                        message = Message(role="agent", parts=parts)
+                        task_status = TaskStatus(state=TaskState.WORKING, message=message)
+                        task_update_event = TaskStatusUpdateEvent(
+                            id=task_send_params.id,
+                            status=task_status,
+                            final=False,
+                        )
+                        hot_log.debug("status", "发送的item的更新消息是: %s", task_update_event)
+                        await self._publish(task_update_event)
+                    elif item.get("type") and item["type"] == "reasoning":
+                        content = item["content"]
+                        hot_log.debug("reasoning", "推理的解析的结果: %s", content)
+                        parts = [{"type": "text", "text": content}]
+                        message = Message(role="agent", parts=parts)
+                        task_status = TaskStatus(state=TaskState.WORKING, message=message)
+                        task_update_event = TaskStatusUpdateEvent(
+                            id=task_send_params.id,
+                            status=task_status,
+                            final=False,
+                        )
+                        hot_log.debug("status", "发送的item的更新消息是: %s", task_update_event)
+                        await self._publish(task_update_event)
+                    elif item.get("type") and item["type"] == "normal":  # 正常的文本内容
+                        is_task_complete = item["is_task_complete"]
+                        if not is_task_complete:
+                            task_state = TaskState.WORKING
+                            if item.get("content"):
+                                # 生成的内容交给 coalescer，按时间窗口或字符数合并后发送
+                                await coalescer.add(item["content"])
+                        else:
+                            if isinstance(item["content"], dict):
+                                if ("response" in item["content"]
+                                        and "result" in item["content"]["response"]):
+                                    data = json.loads(item["content"]["response"]["result"])
+                                    task_state = TaskState.INPUT_REQUIRED
+                                else:
+                                    data = item["content"]
+                                    task_state = TaskState.COMPLETED
+                                parts = [{"type": "data", "data": data}]
+                            else:
+                                task_state = TaskState.COMPLETED
+                                parts = [{"type": "text", "text": item["content"]}]
+                            hot_log.debug("final", "现在发送的parts是: %s", parts)
+                            artifact = Artifact(parts=parts, index=0, append=True, lastChunk=True)
+                            await self._publish(
+                                TaskArtifactUpdateEvent(
                                     id=task_send_params.id,
                                     artifact=artifact,
                                 )
                             )
-                            is_first_token = False
-                            artifacts.append(artifact)
+                            assembler.add(artifact)
+                    elif item.get("require_user_input"):
+                        # agent 出错或者需要用户输入，流在这里结束，循环结束后作为最终状态发送
+                        pass
                     else:
-                        if isinstance(item["content"], dict):
-                            if ("response" in item["content"]
-                                    and "result" in item["content"]["response"]):
-                                data = json.loads(item["content"]["response"]["result"])
-                                task_state = TaskState.INPUT_REQUIRED
-                            else:
-                                data = item["content"]
-                                task_state = TaskState.COMPLETED
-                            parts = [{"type": "data", "data": data}]
-                        else:
-                            task_state = TaskState.COMPLETED
-                            parts = [{"type": "text", "text": item["content"]}]
-                        logger.info(f"现在发送的parts是: {parts}")
-                        artifact = Artifact(parts=parts, index=0, append=True, lastChunk=True)
-                        yield SendTaskStreamingResponse(
-                            id=request.id,
-                            result=TaskArtifactUpdateEvent(
-                                id=task_send_params.id,
-                                artifact=artifact,
-                            )
+                        # 不带工具返回，状态消息
+                        task_status = TaskStatus(
+                            state=TaskState.WORKING,
                         )
-                        artifacts.append(artifact)
-                else:
-                    # 不带工具返回，状态消息
-                    task_status = TaskStatus(
-                        state=TaskState.WORKING,
-                    )
-                    task_update_event = TaskStatusUpdateEvent(
-                        id=task_send_params.id,
-                        status=task_status,
-                        final=False,
-                    )
-                    logger.info(f"发送的item的更新消息是: {task_update_event}")
-                    yield SendTaskStreamingResponse(id=request.id, result=task_update_event)
-            if item["is_task_complete"]:
-                task_status = TaskStatus(
-                    state=TaskState.COMPLETED,
-                )
-            else:
-                task_status = TaskStatus(
-                    state=TaskState.WORKING,
-                )
-            await self.update_store(task_send_params.id, task_status, artifacts)
-            task_update_event = TaskStatusUpdateEvent(
-                id=task_send_params.id,
-                status=task_status,
-                final=False,
+                        task_update_event = TaskStatusUpdateEvent(
+                            id=task_send_params.id,
+                            status=task_status,
+                            final=False,
+                        )
+                        hot_log.debug("status", "发送的item的更新消息是: %s", task_update_event)
+                        await self._publish(task_update_event)
+            await coalescer.flush()
+            logger.info(
+                f"任务 {task_send_params.id} 收到 {coalescer.deltas} 个文本增量，合并后发送了 {coalescer.frames} 个事件"
             )
-            # logger.info(f"发送的更新消息是: {task_update_event}") # 暂时不用最后的更新消息了，只发送最后的结果
-            # yield SendTaskStreamingResponse(id=request.id, result=task_update_event)
-            if item["is_task_complete"]:
-                logger.info(f"发送的任务完成消息")
-                yield SendTaskStreamingResponse(
-                    id=request.id,
-                    result=TaskStatusUpdateEvent(
-                        id=task_send_params.id,
-                        status=TaskStatus(
-                            state=task_status.state,
-                        ),
-                        final=True
-                    )
+            # agent.stream 出错时不抛异常，而是以一个没有完成的 item 结束，流结束后任务不能停在 working
+            task_status = self._final_status(item)
+            await self.update_store(task_send_params.id, task_status, assembler.artifacts())
+            logger.info(f"发送的任务结束消息: {task_status.state.value}")
+            await self._publish(
+                TaskStatusUpdateEvent(
+                    id=task_send_params.id,
+                    status=task_status,
+                    final=True
                 )
+            )
         except Exception as e:
             logger.error(f"An error occurred while streaming the response: {e}")
             traceback_str = traceback.format_exc()
             logger.error(traceback_str)
-            yield JSONRPCResponse(
-                id=request.id,
-                error=InternalError(
-                    message="An error occurred while streaming the response"
-                ),
+            error = InternalError(
+                message="An error occurred while streaming the response"
             )
+            await self.update_store(task_send_params.id, TaskStatus(state=TaskState.FAILED), assembler.artifacts())
+            await self.enqueue_events_for_sse(task_send_params.id, error)
+        except asyncio.CancelledError:
+            await self.mark_task_canceled(task_send_params.id)
+            raise
+        finally:
+            coalescer.close()
+            # 流提前结束时也给重新订阅的客户端一个结束事件
+            task = await self.task_store.get_task(task_send_params.id)
+            if task is not None:
+                await self.finish_event_stream(task_send_params.id, task.status)
+
+    @staticmethod
+    def _final_status(item: dict) -> TaskStatus:
+        """Status of a task whose agent stream ended with ``item``."""
+        if item.get("is_task_complete"):
+            return TaskStatus(state=TaskState.COMPLETED)
+        text = item.get("updates") or "The agent stopped without a result"
+        message = Message(role="agent", parts=[TextPart(text=text)])
+        if item.get("require_user_input"):
+            return TaskStatus(state=TaskState.INPUT_REQUIRED, message=message)
+        return TaskStatus(state=TaskState.FAILED, message=message)
+
+    def _tool_parts(self, kind: str, data: dict) -> list[dict]:
+        """Parts of the status message for a tool call or tool result."""
+        if self.tool_output_mode == "data":
+            return [{"type": "data", "data": data, "metadata": {"type": kind}}]
+        if kind == "tool_call":
+            data = data["tool_calls"]
+        # 只序列化一次，文本和之前的输出格式保持一致
+        return [{"type": "text", "text": json.dumps(data, ensure_ascii=False, indent=2) + "\n"}]
+
+    async def _publish(self, event: TaskStatusUpdateEvent | TaskArtifactUpdateEvent):
+        """Send the event to every subscriber of the task and record it for replay."""
+        await self.enqueue_events_for_sse(event.id, event)
+
 
     def _validate_request(
             self, request: SendTaskRequest | SendTaskStreamingRequest
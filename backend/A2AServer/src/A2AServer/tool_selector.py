@@ -0,0 +1,78 @@
+"""Relevance-based selection of the tools sent with each model request."""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List
+
+_WORD_RE = re.compile(r"[A-Za-z]+|\d+|[\u4e00-\u9fff]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words; camelCase and snake_case are split, CJK runs become unigrams and bigrams."""
+    tokens = []
+    for word in _WORD_RE.findall(_CAMEL_RE.sub(" ", text or "")):
+        if "\u4e00" <= word[0] <= "\u9fff":
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def tool_text(function: Dict) -> str:
+    """Name, description and parameter names and descriptions of a tool definition."""
+    parts = [function["name"], function.get("description") or ""]
+    for name, schema in (function.get("parameters") or {}).get("properties", {}).items():
+        parts.append(name)
+        if isinstance(schema, dict):
+            parts.append(schema.get("description") or "")
+    return " ".join(parts)
+
+
+class ToolSelector:
+    """BM25 index over tool definitions.
+
+    ``select(query)`` returns the ``top_k`` tools most relevant to the query
+    plus every tool named in ``pinned``, in the order of the original list so
+    the tool payload stays stable for similar queries.
+    """
+
+    def __init__(self, functions: List[Dict], top_k: int = 8, pinned: Iterable[str] = (), k1: float = 1.5, b: float = 0.75):
+        self.functions = functions
+        self.top_k = top_k
+        self.pinned = set(pinned)
+        self.k1 = k1
+        self.b = b
+        self._docs = [Counter(tokenize(tool_text(function))) for function in functions]
+        self._lengths = [sum(doc.values()) for doc in self._docs]
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0
+        doc_freq = Counter(token for doc in self._docs for token in doc)
+        n = len(self._docs)
+        self._idf = {token: math.log(1 + (n - df + 0.5) / (df + 0.5)) for token, df in doc_freq.items()}
+
+    def scores(self, query: str) -> List[float]:
+        query_tokens = [token for token in tokenize(query) if token in self._idf]
+        scores = []
+        for doc, length in zip(self._docs, self._lengths):
+            score = 0.0
+            for token in query_tokens:
+                tf = doc.get(token, 0)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * length / self._avg_length)
+                    score += self._idf[token] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def select(self, query: str) -> List[Dict]:
+        if len(self.functions) <= self.top_k:
+            return self.functions
+        scores = self.scores(query)
+        ranked = sorted(range(len(self.functions)), key=lambda i: scores[i], reverse=True)
+        chosen = {i for i in ranked[:self.top_k] if scores[i] > 0}
+        chosen.update(i for i, function in enumerate(self.functions) if function["name"] in self.pinned)
+        if not chosen:
+            # 问题和任何工具都不相关时，仍然把全部工具交给模型决定
+            return self.functions
+        return [function for i, function in enumerate(self.functions) if i in chosen]
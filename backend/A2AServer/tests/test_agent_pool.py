@@ -0,0 +1,112 @@
+"""Leasing and warm-up behaviour of AgentPool.
+
+Uses real BasicAgent contexts with a fake ``generate_text`` and a fake
+``setup_tools``, so no model or MCP server is started. Run with
+``python -m pytest backend/A2AServer/tests`` or directly with
+``python backend/A2AServer/tests/test_agent_pool.py``.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import A2AServer.agent as agent_module
+from A2AServer.agent import BasicAgent
+from A2AServer.agent_pool import AgentPool
+
+
+async def fake_generate_text(conversation, model_cfg, functions, stream=True):
+    questions = [m["content"].split("\n\n")[0] for m in conversation if m["role"] == "user"]
+    text = "echo:" + "|".join(questions)
+
+    async def chunks():
+        await asyncio.sleep(0.01)
+        yield {"assistant_text": text, "tool_calls": [], "is_chunk": False}
+
+    return chunks()
+
+
+def make_pool(directory: str, failing: set, size: int = 4, mcp_replicas: int = 2):
+    """A pool whose replicas with an index in ``failing`` cannot start their servers."""
+    prompt_file = os.path.join(directory, "prompt.txt")
+    config_file = os.path.join(directory, "mcp_config.json")
+    with open(prompt_file, "w", encoding="utf-8") as f:
+        f.write("You are a test agent.")
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump({"mcpServers": {}}, f)
+    setups = []
+    created = []
+
+    def factory():
+        agent = BasicAgent(config_path=config_file, prompt_file=prompt_file, quiet_mode=True)
+        index = len(created)
+        created.append(agent)
+
+        async def setup_tools():
+            setups.append(index)
+            agent.tool_ready = index not in failing
+            agent.servers = {} if index in failing else {f"server{index}": object()}
+            return agent.tool_ready
+
+        agent.setup_tools = setup_tools
+        return agent
+
+    return AgentPool(factory, size=size, mcp_replicas=mcp_replicas), setups
+
+
+async def run_turn(pool: AgentPool, session_id: str, query: str) -> str:
+    answer = ""
+    async with pool.lease(session_id) as agent:
+        async for item in agent.stream(query, session_id):
+            if item.get("type") == "normal":
+                answer += item["content"]
+    return answer
+
+
+async def check_failed_replica_is_not_retried():
+    with tempfile.TemporaryDirectory() as directory:
+        pool, setups = make_pool(directory, failing={0})
+        assert await pool.warmup()
+        await asyncio.gather(*(run_turn(pool, f"s{i}", "q") for i in range(8)))
+        # 失败的副本只启动过一次，所有上下文都用健康副本的 server
+        assert sorted(setups) == [0, 1]
+        assert pool.failed_replicas == 1
+        assert all(context.servers is pool.replicas[1].servers for context in pool.contexts)
+
+
+async def check_session_is_taken_before_lease():
+    with tempfile.TemporaryDirectory() as directory:
+        pool, _ = make_pool(directory, failing=set(), size=1, mcp_replicas=1)
+        # 借出上下文之前拿到的 session 锁在 agent.stream 里可以重入，不会死锁
+        answers = await asyncio.wait_for(
+            asyncio.gather(*(run_turn(pool, "same", str(i)) for i in range(3))), timeout=5
+        )
+        assert sorted(answers, key=len) == ["echo:0", "echo:0|1", "echo:0|1|2"]
+
+
+def test_failed_replica_is_not_retried():
+    original = agent_module.generate_text
+    agent_module.generate_text = fake_generate_text
+    try:
+        asyncio.run(check_failed_replica_is_not_retried())
+    finally:
+        agent_module.generate_text = original
+
+
+def test_session_is_taken_before_lease():
+    original = agent_module.generate_text
+    agent_module.generate_text = fake_generate_text
+    try:
+        asyncio.run(check_session_is_taken_before_lease())
+    finally:
+        agent_module.generate_text = original
+
+
+if __name__ == "__main__":
+    test_failed_replica_is_not_retried()
+    test_session_is_taken_before_lease()
+    print("OK")
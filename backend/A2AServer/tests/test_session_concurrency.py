@@ -0,0 +1,124 @@
+"""Concurrency check for per-session conversations in BasicAgent.
+
+Runs 100 sessions in parallel against a fake ``generate_text`` that echoes
+every user message it was given, so an answer shows exactly which history
+its turn saw. Run with ``python -m pytest backend/A2AServer/tests`` or
+directly with ``python backend/A2AServer/tests/test_session_concurrency.py``.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import A2AServer.agent as agent_module
+from A2AServer.agent import BasicAgent
+from A2AServer.session_store import SessionStore
+
+SESSIONS = 100
+
+
+async def fake_generate_text(conversation, model_cfg, functions, stream=True):
+    # 取调用时的快照，之后对话被修改也不影响这次的回答
+    questions = [m["content"].split("\n\n")[0] for m in conversation if m["role"] == "user"]
+    text = "echo:" + "|".join(questions)
+
+    async def chunks():
+        await asyncio.sleep(random.random() * 0.01)
+        for piece in (text[:5], text[5:]):
+            await asyncio.sleep(random.random() * 0.005)
+            yield {"assistant_text": piece, "tool_calls": [], "is_chunk": True, "token": True}
+        yield {"assistant_text": text, "tool_calls": [], "is_chunk": False}
+
+    return chunks()
+
+
+def make_agent(directory: str) -> BasicAgent:
+    prompt_file = os.path.join(directory, "prompt.txt")
+    config_file = os.path.join(directory, "mcp_config.json")
+    with open(prompt_file, "w", encoding="utf-8") as f:
+        f.write("You are a test agent.")
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump({"mcpServers": {}}, f)
+    agent = BasicAgent(config_path=config_file, prompt_file=prompt_file, quiet_mode=True)
+    # 没有 MCP server，跳过工具初始化
+    agent.tool_ready = True
+    return agent
+
+
+async def run_turn(agent: BasicAgent, session_id: str, query: str) -> str:
+    answer = ""
+    async for item in agent.stream(query, session_id):
+        if item.get("type") == "normal":
+            answer += item["content"]
+    return answer
+
+
+async def check_parallel_sessions():
+    with tempfile.TemporaryDirectory() as directory:
+        agent = make_agent(directory)
+        first = await asyncio.gather(*(run_turn(agent, f"s{i}", f"q{i}a") for i in range(SESSIONS)))
+        second = await asyncio.gather(*(run_turn(agent, f"s{i}", f"q{i}b") for i in range(SESSIONS)))
+        # 每个回答只看到自己 session 的历史
+        assert first == [f"echo:q{i}a" for i in range(SESSIONS)]
+        assert second == [f"echo:q{i}a|q{i}b" for i in range(SESSIONS)]
+        assert len(agent.sessions) == SESSIONS
+
+        # 同一个 session 的两轮并发请求按顺序执行，后一轮能看到前一轮
+        answers = await asyncio.gather(run_turn(agent, "same", "1"), run_turn(agent, "same", "2"))
+        assert sorted(answers) == ["echo:1", "echo:1|2"] or sorted(answers) == ["echo:2", "echo:2|1"]
+
+
+def test_parallel_sessions_keep_their_own_history():
+    original = agent_module.generate_text
+    agent_module.generate_text = fake_generate_text
+    try:
+        asyncio.run(check_parallel_sessions())
+    finally:
+        agent_module.generate_text = original
+
+
+def test_session_store_is_bounded():
+    store = SessionStore(max_sessions=10)
+    for i in range(50):
+        store.get(str(i))
+    assert len(store) == 10
+    assert store.evictions == 40
+
+
+async def check_evicted_session_is_not_split():
+    with tempfile.TemporaryDirectory() as directory:
+        agent = make_agent(directory)
+        agent.sessions = SessionStore(max_sessions=2)
+        first = await agent.run_inference("1", "a")
+        # 第一轮还没开始，"a" 被其它 session 挤出去之后又来了同一个 session 的第二轮
+        for i in range(3):
+            agent.sessions.get(f"other{i}")
+        second = await agent.run_inference("2", "a")
+
+        async def collect(generator):
+            return "".join(chunk["text"] for chunk in [c async for c in generator] if chunk["type"] == "normal")
+
+        answers = await asyncio.gather(collect(first), collect(second))
+        # 两轮用的是同一个 session，按顺序执行，后一轮看到前一轮
+        assert sorted(answers) == ["echo:1", "echo:1|2"] or sorted(answers) == ["echo:2", "echo:2|1"]
+
+
+def test_evicted_session_is_not_split():
+    original = agent_module.generate_text
+    agent_module.generate_text = fake_generate_text
+    try:
+        asyncio.run(check_evicted_session_is_not_split())
+    finally:
+        agent_module.generate_text = original
+
+
+if __name__ == "__main__":
+    test_parallel_sessions_keep_their_own_history()
+    test_session_store_is_bounded()
+    test_evicted_session_is_not_split()
+    print(f"OK: {SESSIONS} parallel sessions")
@@ -0,0 +1,127 @@
+"""End states of streaming tasks in AgentTaskManager.
+
+Runs tasks/sendSubscribe against fake agents whose stream ends in the
+different ways ``BasicAgent.stream`` can end, and checks that neither the
+stored task nor the final SSE event is left in the ``working`` state. Run
+with ``python -m pytest backend/A2AServer/tests`` or directly with
+``python backend/A2AServer/tests/test_task_manager.py``.
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from A2AServer.common.A2Atypes import (
+    GetTaskRequest,
+    SendTaskStreamingRequest,
+    TaskState,
+    TaskStatusUpdateEvent,
+)
+from A2AServer.common.server import InMemoryTaskStore
+from A2AServer.task_manager import AgentTaskManager
+
+
+class FakeAgent:
+    """Stands in for BasicAgent and yields ``items`` from ``stream``."""
+
+    tool_ready = True
+
+    def __init__(self, items, error=None):
+        self.items = items
+        self.error = error
+
+    async def warmup(self):
+        return True
+
+    async def stream(self, query, sessionId):
+        for item in self.items:
+            await asyncio.sleep(0)
+            yield item
+        if self.error is not None:
+            raise self.error
+
+
+PROCESSING = {"is_task_complete": False, "require_user_input": False, "updates": "Processing request..."}
+TEXT = {"is_task_complete": False, "require_user_input": False, "content": "hi", "type": "normal"}
+COMPLETE = {"is_task_complete": True, "require_user_input": False, "content": " "}
+# BasicAgent.stream 出错时不抛异常，以这样的 item 结束
+ERROR = {"is_task_complete": False, "require_user_input": True, "updates": "Error processing request: boom"}
+
+
+async def run_task(agent, manager=None, task_id="task-1") -> tuple[TaskState, list]:
+    manager = manager or AgentTaskManager(agent)
+    request = SendTaskStreamingRequest.model_validate({
+        "id": 1,
+        "params": {
+            "id": task_id,
+            "sessionId": "session-1",
+            "message": {"role": "user", "parts": [{"type": "text", "text": "hello"}]},
+        },
+    })
+    stream = await manager.on_send_task_subscribe(request)
+    responses = [response async for response in stream]
+    get = await manager.on_get_task(GetTaskRequest.model_validate({"id": 2, "params": {"id": task_id}}))
+    return get.result.status.state, responses
+
+
+def final_event(responses) -> TaskStatusUpdateEvent:
+    final = responses[-1].result
+    assert isinstance(final, TaskStatusUpdateEvent) and final.final
+    return final
+
+
+def test_completed_run():
+    state, responses = asyncio.run(run_task(FakeAgent([PROCESSING, TEXT, COMPLETE])))
+    final = final_event(responses)
+    assert state == final.status.state == TaskState.COMPLETED
+
+
+def test_agent_error_is_not_left_working():
+    state, responses = asyncio.run(run_task(FakeAgent([PROCESSING, TEXT, ERROR])))
+    final = final_event(responses)
+    assert state == final.status.state == TaskState.INPUT_REQUIRED
+    assert "boom" in final.status.message.parts[0].text
+
+
+def test_stream_ending_without_result_fails():
+    state, responses = asyncio.run(run_task(FakeAgent([PROCESSING, TEXT])))
+    final = final_event(responses)
+    assert state == final.status.state == TaskState.FAILED
+
+
+def test_stream_raising_fails():
+    state, responses = asyncio.run(run_task(FakeAgent([PROCESSING], error=RuntimeError("boom"))))
+    # 异常以一个错误响应结束这个 SSE 流
+    assert state == TaskState.FAILED
+    assert responses[-1].error is not None
+
+
+async def check_eviction_releases_buffers():
+    agent = FakeAgent([PROCESSING, TEXT, COMPLETE])
+    store = InMemoryTaskStore(max_tasks=2, terminal_ttl=60)
+    manager = AgentTaskManager(agent, task_store=store)
+    for i in range(5):
+        await run_task(agent, manager, f"task-{i}")
+    # 被淘汰的任务不再占用重放缓冲区
+    assert set(manager.task_event_buffers) == set(store.tasks) == {"task-3", "task-4"}
+    # 订阅者离开后不留下空的订阅者列表
+    assert manager.task_sse_subscribers == {}
+    store.terminal_ttl = 0
+    await store.sweep()
+    assert manager.task_event_buffers == {}
+    await store.close()
+
+
+def test_evicted_tasks_release_replay_buffers():
+    asyncio.run(check_eviction_releases_buffers())
+
+
+if __name__ == "__main__":
+    test_completed_run()
+    test_agent_error_is_not_left_working()
+    test_stream_ending_without_result_fails()
+    test_stream_raising_fails()
+    test_evicted_tasks_release_replay_buffers()
+    print("OK")
@@ -2,10 +2,12 @@ import click
 import os
 import sys
 import logging
-from A2AServer.common.server import A2AServer
+from A2AServer.common.server import A2AServer, SQLiteTaskStore, InMemoryTaskStore
 from A2AServer.common.A2Atypes import AgentCard, AgentCapabilities, AgentSkill, MissingAPIKeyError
 from A2AServer.task_manager import AgentTaskManager
 from A2AServer.agent import BasicAgent
+from A2AServer.agent_pool import AgentPool
+from A2AServer.common.utils.hot_log import setup_queued_logging
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,6 +21,8 @@ logging.basicConfig(
     stream=sys.stdout,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
 )
+# 日志在后台线程写出，不阻塞事件循环
+setup_queued_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -29,12 +33,28 @@ logger = logging.getLogger(__name__)
 @click.option("--model", "model_name", default="deepseek-chat",help="使用的模型名称（如 deepseek-chat）")
 @click.option("--provider", "provider", default="deepseek", help="模型提供方名称（如 deepseek、openai 等）")
 @click.option("--mcp_config", "mcp_config_path", default="mcp_config.json",help="MCP 配置文件路径（默认为 mcp_config.json）")
-def main(host, port, agent_prompt_file, model_name, provider, mcp_config_path):
+@click.option("--workers", "workers", default=1, help="服务器的进程数（默认为 1，大于 1 时需要指定 --task_db）")
+@click.option("--task_db", "task_db", default=None, help="SQLite 任务存储文件路径，多进程之间共享任务状态（默认不持久化）")
+@click.option("--max_tasks", "max_tasks", default=None, type=int, help="内存中最多保留的任务数，超出时淘汰最久未使用的已结束任务（默认不限制）")
+@click.option("--task_ttl", "task_ttl", default=None, type=float, help="已结束任务在内存中的保留秒数（默认不过期）")
+@click.option("--task_flush_interval", "task_flush_interval", default=0.0, type=float, help="SQLite 任务存储的批量写入间隔，单位秒，只支持单进程（默认 0，每次更新立即写入）")
+@click.option("--coalesce_ms", "coalesce_ms", default=0.0, type=float, help="流式输出时合并文本增量的时间窗口，单位毫秒（默认 0，不合并）")
+@click.option("--tool_output", "tool_output", default="text", type=click.Choice(["text", "data"]), help="工具调用和结果的输出方式：text 为格式化的 JSON 文本，data 为 DataPart（默认 text）")
+@click.option("--pool_size", "pool_size", default=None, type=int, help="Agent 池的上下文数，并发请求各自借用一个上下文（默认不使用池）")
+@click.option("--mcp_replicas", "mcp_replicas", default=1, type=int, help="Agent 池中启动的 MCP server 副本数，上下文轮流共用（默认 1）")
+def main(host, port, agent_prompt_file, model_name, provider, mcp_config_path, workers, task_db, max_tasks, task_ttl, task_flush_interval, coalesce_ms, tool_output, pool_size, mcp_replicas):
     """启动A2A Server
     host: 启动的Agent的主机
     port: 启动的端口
     agent_prompt_file: prompt文件
     """
+    if task_db and (max_tasks is not None or task_ttl is not None):
+        raise click.UsageError("--max_tasks and --task_ttl only apply to the in-memory task store and cannot be used with --task_db")
+    if task_flush_interval > 0 and not task_db:
+        raise click.UsageError("--task_flush_interval requires --task_db")
+    if task_flush_interval > 0 and workers > 1:
+        # 批量写入时更新不再是跨进程原子的，多个进程会互相覆盖
+        raise click.UsageError("--task_flush_interval cannot be used with --workers > 1")
     input_mode, output_mode = ["text", "text/plain"], ["text", "text/plain"]
     # Agent支持的输入和输出，默认只支持文本
     BasicAgent.SUPPORTED_CONTENT_TYPES = input_mode
@@ -61,13 +81,25 @@ def main(host, port, agent_prompt_file, model_name, provider, mcp_config_path):
             capabilities=capabilities,
             skills=[skill],
         )
-        agent = BasicAgent(config_path=mcp_config_path, model_name=model_name, prompt_file=agent_prompt_file, provider=provider)
+        if pool_size:
+            agent = AgentPool(
+                lambda: BasicAgent(config_path=mcp_config_path, model_name=model_name, prompt_file=agent_prompt_file, provider=provider),
+                size=pool_size,
+                mcp_replicas=mcp_replicas,
+            )
+        else:
+            agent = BasicAgent(config_path=mcp_config_path, model_name=model_name, prompt_file=agent_prompt_file, provider=provider)
         # 启动 A2A 服务器
+        if task_db:
+            task_store = SQLiteTaskStore(task_db, flush_interval=task_flush_interval)
+        else:
+            task_store = InMemoryTaskStore(max_tasks=max_tasks, terminal_ttl=task_ttl)
         server = A2AServer(
             agent_card=agent_card,
-            task_manager=AgentTaskManager(agent=agent),
+            task_manager=AgentTaskManager(agent=agent, task_store=task_store, coalesce_ms=coalesce_ms, tool_output_mode=tool_output),
             host=host,
             port=port,
+            workers=workers,
         )
 
         logger.info(f"Starting agent on {host}:{port}")